@@ -0,0 +1,107 @@
+import importlib.util
+import os
+import sys
+import types
+from typing import Callable, List, Tuple
+
+import fixtures
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "server_sniffer_utils")
+ANSIBLE_MODULES_DIR = os.path.join(PACKAGE_DIR, "ansible_modules")
+ANSIBLE_MODULE_UTILS_DIR = os.path.join(PACKAGE_DIR, "ansible_module_utils")
+
+sys.path.append(PACKAGE_DIR)
+
+from packages import expand_packages
+
+
+def load_ansible_module(module_name: str) -> types.ModuleType:
+    # the modules import their helpers from ansible.module_utils, like ANSIBLE_MODULE_UTILS does for a playbook run
+    import ansible.module_utils
+
+    module_utils_dir = os.path.abspath(ANSIBLE_MODULE_UTILS_DIR)
+    if module_utils_dir not in ansible.module_utils.__path__:
+        ansible.module_utils.__path__.append(module_utils_dir)
+
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ANSIBLE_MODULES_DIR, f"{module_name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    # registered so that the functions sent to the analysis workers can be pickled
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# wildfly_info
+# ----------------------------------------------------------------------------------------------------------------------
+def get_wildfly_benchmarks(scale: dict, work_dir: str) -> List[Tuple[str, dict, Callable]]:
+    ret = []
+    wildfly_info = load_ansible_module("wildfly_info")
+
+    content_dir = os.path.join(work_dir, "content")
+    archive = {key: scale[key] for key in ("wars", "jars_per_war", "files_per_jar")}
+    deployment_hashes = fixtures.write_deployment_contents(content_dir, scale["deployments"], **archive)
+    ear_path = wildfly_info.list_deployment_contents(content_dir)[0][1]
+
+    for size in ("small", "large"):
+        datasources = scale["datasources"] if size == "large" else max(1, scale["datasources"] // 10)
+        params = {"datasources": datasources, "users": datasources, "handlers": datasources}
+        standalone_xml = fixtures.generate_standalone_xml(datasources, datasources, datasources, deployment_hashes)
+        params["bytes"] = len(standalone_xml)
+        wildfly_config = wildfly_info.WildflyConfig(standalone_xml)
+
+        ret.append((f"wildfly_info.WildflyConfig[{size}]", params, lambda xml=standalone_xml: wildfly_info.WildflyConfig(xml)))
+        ret.append((f"wildfly_info.get_users_info[{size}]", params, lambda config=wildfly_config: wildfly_info.get_users_info(config)))
+        ret.append((f"wildfly_info.get_datasources_info[{size}]", params, lambda config=wildfly_config: wildfly_info.get_datasources_info(config)))
+        ret.append((f"wildfly_info.get_logs_info[{size}]", params, lambda config=wildfly_config: wildfly_info.get_logs_info(config)))
+
+    ret.append(("wildfly_info.extract_deployment_data", archive, lambda: wildfly_info.extract_deployment_data(ear_path)))
+
+    # an empty cache on every run, so every archive is analysed
+    params = dict(archive, deployments=scale["deployments"])
+    wildfly_config = wildfly_info.WildflyConfig(fixtures.generate_standalone_xml(1, 1, 1, deployment_hashes))
+    ret.append(("wildfly_info.get_deployments_info", params, lambda: wildfly_info.get_deployments_info(wildfly_config, content_dir, {})))
+
+    return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# wildfly_info
+#/----------------------------------------------------------------------------------------------------------------------
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# system_info
+# ----------------------------------------------------------------------------------------------------------------------
+def get_system_benchmarks(scale: dict, work_dir: str) -> List[Tuple[str, dict, Callable]]:
+    ret = []
+    system_info = load_ansible_module("system_info")
+
+    # the module reads fixed system paths, they are pointed at the generated trees
+    logrotate_dir = os.path.join(work_dir, "logrotate.d")
+    fixtures.write_logrotate_tree(logrotate_dir, scale["logrotate_files"])
+    system_info.LOGROTATE_CONF_DIR = logrotate_dir
+
+    rpm_output = fixtures.generate_rpm_output(scale["packages"], 0)
+    yumdb_dir = os.path.join(work_dir, "yumdb")
+    fixtures.write_yumdb_tree(yumdb_dir, rpm_output)
+    system_info.YUMDB_DIR = yumdb_dir
+
+    # rpm itself is not run, its output is replayed
+    rpm_stdout = rpm_output.encode("utf-8")
+    system_info.run_command = lambda cmd: rpm_stdout
+    packages = system_info.query_rpm_cli()
+    # the columns returned by the module, as the gatherer expands them
+    rpm_columns = dict(packages, repository=system_info.get_pkg_repositories(packages))
+
+    params = {"files": scale["logrotate_files"]}
+    ret.append(("system_info.get_logrotate_info", params, system_info.get_logrotate_info))
+    ret.append(("system_info.get_dir_fingerprint", params, lambda: system_info.get_dir_fingerprint(logrotate_dir)))
+
+    params = {"packages": scale["packages"]}
+    ret.append(("system_info.query_rpm_cli", params, system_info.query_rpm_cli))
+    ret.append(("system_info.get_pkg_repositories", params, lambda: system_info.get_pkg_repositories(packages)))
+    ret.append(("packages.expand_packages", params, lambda: expand_packages(rpm_columns)))
+
+    return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# system_info
+#/----------------------------------------------------------------------------------------------------------------------
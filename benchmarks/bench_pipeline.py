@@ -0,0 +1,100 @@
+import os
+import sys
+from typing import Callable, List, Tuple
+
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "server_sniffer_utils"))
+
+import mongo_helper
+from ansible_gatherer import AnsibleGatherer
+from mongo_helper import SNAPSHOTS_LAYOUT, MongoHelper
+from packages import decode_packages, encode_packages
+from snapshot_diff import diff_snapshots, find_natural_key
+from snapshot_sections import compute_section_hashes
+
+BENCH_DB_NAME = "server_sniffer_bench"
+
+
+def get_gatherer_benchmarks(scale: dict) -> List[Tuple[str, dict, Callable]]:
+    ret = []
+
+    # the private helpers don't use the inventory, the constructor is skipped
+    gatherer = object.__new__(AnsibleGatherer)
+    fix_ansible_facts = gatherer._AnsibleGatherer__fix_ansible_facts
+    ansible_facts = fixtures.generate_ansible_facts(scale["interfaces"], scale["mounts"], scale["devices"])
+    params = {"interfaces": scale["interfaces"], "mounts": scale["mounts"], "devices": scale["devices"]}
+    ret.append(("AnsibleGatherer.__fix_ansible_facts", params, lambda: fix_ansible_facts(ansible_facts)))
+
+    rows = fixtures.generate_snapshot(scale["packages"], 0, 0)["system_info"]["packages"]
+    columnar = encode_packages(rows)
+    params = {"packages": scale["packages"]}
+    ret.append(("packages.encode_packages", params, lambda: encode_packages(rows)))
+    ret.append(("packages.decode_packages", params, lambda: decode_packages(columnar)))
+
+    return ret
+
+
+def get_diff_benchmarks(scale: dict) -> List[Tuple[str, dict, Callable]]:
+    ret = []
+
+    snapshot_x = fixtures.generate_snapshot(scale["packages"], scale["deployments"], 0)
+    snapshot_y = fixtures.mutate_snapshot(snapshot_x, scale["changes"], 1)
+    params = {"packages": scale["packages"], "deployments": scale["deployments"], "changes": scale["changes"]}
+
+    # the diffs don't use the database, the connection set up by the constructor is skipped
+    helper = object.__new__(MongoHelper)
+    ret.append(("MongoHelper.get_ddiff", params, lambda: helper.get_ddiff(snapshot_x, snapshot_y)))
+
+    # both engines are compared on snapshots without lists of dicts, the only ones the DeepDiff path handles
+    keyed_x = key_snapshot_lists(snapshot_x)
+    keyed_y = key_snapshot_lists(snapshot_y)
+    ret.append(("MongoHelper.get_ddiff[keyed]", params, lambda: helper.get_ddiff(keyed_x, keyed_y)))
+    ret.append(("MongoHelper.get_deepdiff[keyed]", params, lambda: helper.get_deepdiff(keyed_x, keyed_y)))
+
+    hashed_x = dict(snapshot_x, section_hashes=compute_section_hashes(snapshot_x))
+    hashed_y = dict(snapshot_y, section_hashes=compute_section_hashes(snapshot_y))
+    ret.append(("snapshot_diff.diff_snapshots[hashed]", params, lambda: diff_snapshots(hashed_x, hashed_y)))
+    ret.append(("snapshot_sections.compute_section_hashes", params, lambda: compute_section_hashes(snapshot_x)))
+
+    return ret
+
+
+def key_snapshot_lists(snapshot: dict) -> dict:
+    # the DeepDiff path can't walk list indices, the lists of dicts are keyed by their natural key instead
+    ret = {}
+
+    for module_name, module_info in snapshot.items():
+        ret[module_name] = {}
+        for key, value in module_info.items():
+            natural_key = find_natural_key(value, []) if isinstance(value, list) else None
+            if natural_key is not None:
+                value = {str(item[natural_key]): item for item in value}
+            ret[module_name][key] = value
+
+    return ret
+
+
+def get_store_benchmarks(scale: dict, mongo_host: str=None, mongo_port: int=27017) -> List[Tuple[str, dict, Callable]]:
+    # a local mongod when given, mongomock otherwise
+    if mongo_host is None:
+        import mongomock
+        mongo_helper.get_client = lambda *args, **kwargs: mongomock.MongoClient()
+
+    helper = MongoHelper(BENCH_DB_NAME, mongo_host or "localhost", mongo_port, layout=SNAPSHOTS_LAYOUT)
+    helper.client.drop_database(BENCH_DB_NAME)
+
+    hosts = scale["hosts"]
+    documents = [fixtures.generate_snapshot(scale["packages"], scale["deployments"], idx, f"bench-host-{idx}") for idx in range(hosts)]
+    params = {"hosts": hosts, "packages": scale["packages"], "backend": "mongod" if mongo_host else "mongomock"}
+
+    def write_documents():
+        helper.write_documents("2000-01-01", iter(documents), upsert=True)
+
+    write_documents()
+
+    ret = []
+    ret.append(("MongoHelper.write_documents", params, write_documents))
+    ret.append(("MongoHelper.find_document", params, lambda: helper.find_document("2000-01-01", "bench-host-0")))
+    ret.append(("MongoHelper.get_documents", params, lambda: helper.get_documents("2000-01-01")))
+    return ret
@@ -0,0 +1,246 @@
+import copy
+import io
+import os
+import random
+import zipfile
+from typing import Dict, List
+
+ROOT_NS = "urn:jboss:domain:16.0"
+DATASOURCES_NS = "urn:jboss:domain:datasources:6.0"
+LOGGING_NS = "urn:jboss:domain:logging:8.0"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Wildfly fixtures
+# ----------------------------------------------------------------------------------------------------------------------
+def generate_standalone_xml(datasources: int, users: int, handlers: int, deployment_hashes: List[str]) -> str:
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>', f'<server xmlns="{ROOT_NS}">']
+
+    lines.append("<management><access-control provider=\"rbac\"><role-mapping>")
+    for idx in range(users):
+        lines.append(f'<role name="role{idx}"><include><user name="user{idx}"/><group name="group{idx}"/></include></role>')
+    lines.append("</role-mapping></access-control></management>")
+
+    lines.append("<profile>")
+    lines.append(f'<subsystem xmlns="{LOGGING_NS}">')
+    for idx in range(handlers):
+        lines.append(f'<periodic-rotating-file-handler name="FILE{idx}">')
+        lines.append(f'<file relative-to="jboss.server.log.dir" path="app{idx}.log"/>')
+        lines.append(f'<rotate-size value="{idx + 1}0m"/>')
+        lines.append("</periodic-rotating-file-handler>")
+    lines.append("</subsystem>")
+
+    lines.append(f'<subsystem xmlns="{DATASOURCES_NS}"><datasources>')
+    for idx in range(datasources):
+        lines.append(f'<datasource jndi-name="java:/jdbc/ds{idx}" pool-name="ds{idx}">')
+        lines.append(f"<connection-url>jdbc:oracle:thin:@db{idx}.example.com:1521/SRV{idx}</connection-url>")
+        lines.append("<driver>oracle</driver>")
+        lines.append(f"<security><user-name>user{idx}</user-name><password>secret</password></security>")
+        lines.append("</datasource>")
+    lines.append("</datasources></subsystem>")
+
+    # filler subsystems make the file size grow like on real servers
+    for idx in range(datasources):
+        lines.append(f'<subsystem xmlns="urn:jboss:domain:filler{idx}:1.0"><setting name="s{idx}" value="{idx}"/></subsystem>')
+    lines.append("</profile>")
+
+    lines.append("<deployments>")
+    for idx, deployment_hash in enumerate(deployment_hashes):
+        lines.append(f'<deployment name="app{idx}.ear" runtime-name="app{idx}.ear"><content sha1="{deployment_hash}"/></deployment>')
+    lines.append("</deployments>")
+
+    lines.append("</server>")
+    return "\n".join(lines)
+
+
+def generate_ear(wars: int, jars_per_war: int, files_per_jar: int, seed: int) -> bytes:
+    # ear > war > jar, like the archives deployed on the application servers
+    rnd = random.Random(seed)
+    ear_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(ear_buffer, "w", zipfile.ZIP_DEFLATED) as ear_file:
+        ear_file.writestr("META-INF/jboss-deployment-structure.xml", generate_deployment_structure(wars))
+        ear_file.writestr("META-INF/application.xml", f"<application><module><web><context-root>/app{seed}</context-root></web></module></application>")
+
+        for war_idx in range(wars):
+            war_buffer = io.BytesIO()
+            with zipfile.ZipFile(war_buffer, "w", zipfile.ZIP_DEFLATED) as war_file:
+                war_file.writestr("WEB-INF/web.xml", generate_web_xml(rnd.randint(1, 5)))
+                war_file.writestr("WEB-INF/classes/log4j.xml", generate_log4j_xml(war_idx))
+                war_file.writestr("WEB-INF/classes/app.properties", f"dsName=java:/jdbc/app/ds{war_idx}\n")
+
+                for jar_idx in range(jars_per_war):
+                    jar_buffer = io.BytesIO()
+                    with zipfile.ZipFile(jar_buffer, "w", zipfile.ZIP_DEFLATED) as jar_file:
+                        for file_idx in range(files_per_jar):
+                            jar_file.writestr(f"com/example/Class{file_idx}.class", os.urandom(512))
+                        jar_file.writestr("META-INF/config.properties", f"key{jar_idx}=value{rnd.random()}\n")
+                    war_file.writestr(f"WEB-INF/lib/lib{jar_idx}.jar", jar_buffer.getvalue())
+
+            ear_file.writestr(f"web{war_idx}.war", war_buffer.getvalue())
+
+    return ear_buffer.getvalue()
+
+
+def generate_deployment_structure(sub_deployments: int) -> str:
+    lines = ["<jboss-deployment-structure>", "<deployment><dependencies>"]
+    lines.extend(f'<module name="org.example.module{idx}"/>' for idx in range(5))
+    lines.append("</dependencies></deployment>")
+    for idx in range(sub_deployments):
+        lines.append(f'<sub-deployment name="web{idx}.war"><dependencies><module name="org.example.web{idx}"/></dependencies></sub-deployment>')
+    lines.append("</jboss-deployment-structure>")
+    return "\n".join(lines)
+
+
+def generate_web_xml(roles: int) -> str:
+    lines = ["<web-app>"]
+    lines.extend(f"<security-role><role-name> role{idx} </role-name></security-role>" for idx in range(roles))
+    lines.append("</web-app>")
+    return "\n".join(lines)
+
+
+def generate_log4j_xml(idx: int) -> str:
+    lines = ["<log4j>", '<appender name="FILE">']
+    lines.append(f'<param name="File" value="${{jboss.server.log.dir}}/app{idx}.log"/>')
+    lines.append('<param name="MaxFileSize" value="10MB"/>')
+    lines.append("</appender>")
+    lines.append("</log4j>")
+    return "\n".join(lines)
+
+
+def write_deployment_contents(content_dir: str, deployments: int, wars: int, jars_per_war: int, files_per_jar: int) -> List[str]:
+    # same layout as the wildfly content repository: <sha1[:2]>/<sha1[2:]>/content
+    ret = []
+
+    for idx in range(deployments):
+        deployment_hash = f"{idx + 1:040x}"
+        deployment_dir = os.path.join(content_dir, deployment_hash[:2], deployment_hash[2:])
+        os.makedirs(deployment_dir, exist_ok=True)
+
+        with open(os.path.join(deployment_dir, "content"), "wb") as content_file:
+            content_file.write(generate_ear(wars, jars_per_war, files_per_jar, idx))
+
+        ret.append(deployment_hash)
+
+    return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# Wildfly fixtures
+#/----------------------------------------------------------------------------------------------------------------------
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# System fixtures
+# ----------------------------------------------------------------------------------------------------------------------
+def write_logrotate_tree(logrotate_dir: str, files: int) -> None:
+    os.makedirs(logrotate_dir, exist_ok=True)
+
+    for idx in range(files):
+        with open(os.path.join(logrotate_dir, f"app{idx}"), "w") as conf_file:
+            conf_file.write(f"# logrotate configuration of app{idx}\n")
+            conf_file.write(f"/var/log/app{idx}/*.log\n/var/log/app{idx}/*.out\n")
+            conf_file.write("{\n\tdaily\n\trotate 7\n\tcompress\n\tmissingok\n\tnotifempty\n\tcopytruncate\n}\n")
+
+
+def generate_rpm_output(packages: int, seed: int) -> str:
+    # rpm -qa output in the query format used by system_info
+    rnd = random.Random(seed)
+    lines = []
+
+    for idx in range(packages):
+        epoch = str(rnd.randint(1, 3)) if rnd.random() < 0.1 else "(none)"
+        lines.append(f"pkg-{idx}\t{epoch}\t1.{rnd.randint(0, 20)}.{rnd.randint(0, 9)}\t{rnd.randint(1, 9)}.el7\tx86_64")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_yumdb_tree(yumdb_dir: str, rpm_output: str) -> None:
+    for idx, line in enumerate(rpm_output.splitlines()):
+        name, _, version, release, arch = line.split("\t")
+        pkg_dir = os.path.join(yumdb_dir, name[0], f"{idx:040x}-{name}-{version}-{release}-{arch}")
+        os.makedirs(pkg_dir, exist_ok=True)
+
+        with open(os.path.join(pkg_dir, "from_repo"), "w") as from_repo_file:
+            from_repo_file.write("base\n" if idx % 3 else "epel\n")
+
+
+def generate_ansible_facts(interfaces: int, mounts: int, devices: int) -> Dict:
+    ret = {}
+
+    ret["ansible_distribution"] = "CentOS"
+    ret["ansible_distribution_release"] = "Core"
+    ret["ansible_distribution_version"] = "7.9"
+    ret["ansible_architecture"] = "x86_64"
+    ret["ansible_processor"] = ["0", "GenuineIntel", "Intel(R) Xeon(R) CPU"] * 8
+    ret["ansible_processor_cores"] = 4
+    ret["ansible_processor_count"] = 2
+    ret["ansible_processor_nproc"] = 8
+    ret["ansible_processor_threads_per_core"] = 1
+    ret["ansible_processor_vcpus"] = 8
+    ret["ansible_memory_mb"] = {"real": {"total": 16000, "free": 2000}, "swap": {"total": 4000, "free": 4000}}
+    ret["ansible_devices"] = {f"sd{chr(97 + idx % 26)}{idx}": {"size": "100 GB", "partitions": {}} for idx in range(devices)}
+    ret["ansible_mounts"] = [{"mount": f"/mnt/{idx}", "size_total": 10 ** 9, "size_available": 10 ** 8} for idx in range(mounts)]
+    ret["ansible_all_ipv4_addresses"] = [f"10.0.{idx // 256}.{idx % 256}" for idx in range(interfaces)]
+    ret["ansible_default_ipv4"] = {"address": "10.0.0.0", "interface": "eth0"}
+    ret["ansible_all_ipv6_addresses"] = []
+    ret["ansible_default_ipv6"] = {}
+    ret["ansible_dns"] = {"nameservers": ["10.0.0.1"], "search": ["example.com"]}
+    ret["ansible_domain"] = "example.com"
+    ret["ansible_fqdn"] = "bench-host.example.com"
+    ret["ansible_hostname"] = "bench-host"
+
+    ret["ansible_interfaces"] = [f"eth{idx}" for idx in range(interfaces)]
+    for idx in range(interfaces):
+        ret[f"ansible_eth{idx}"] = {"device": f"eth{idx}", "mtu": 1500, "active": True, "ipv4": {"address": f"10.0.{idx // 256}.{idx % 256}"}}
+
+    # facts outside the whitelist are gathered anyway and dropped by the gatherer
+    for idx in range(200):
+        ret[f"ansible_unused_fact_{idx}"] = {"value": idx}
+
+    return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# System fixtures
+#/----------------------------------------------------------------------------------------------------------------------
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Snapshot fixtures
+# ----------------------------------------------------------------------------------------------------------------------
+def generate_snapshot(packages: int, deployments: int, seed: int, hostname: str="bench-host") -> dict:
+    rnd = random.Random(seed)
+    ret = {"system_info": {}, "wildfly_info": {}}
+
+    system_info = ret["system_info"]
+    system_info["hostname"] = hostname
+    system_info["packages"] = [
+        {"pkg_name": f"pkg-{idx}.x86_64", "version": f"1.{rnd.randint(0, 9)}-1.el7", "repository": "@base"}
+        for idx in range(packages)
+    ]
+    system_info["interfaces"] = [{"device": f"eth{idx}", "mtu": 1500, "active": True} for idx in range(4)]
+    system_info["mounts"] = [{"mount": f"/mnt/{idx}", "size_total": 10 ** 9, "size_available": rnd.randint(0, 10 ** 9)} for idx in range(8)]
+
+    wildfly_info = ret["wildfly_info"]
+    wildfly_info["datasources"] = [{"jndi_name": f"java:/jdbc/ds{idx}", "driver": "oracle"} for idx in range(20)]
+    wildfly_info["deployments"] = [
+        {"sha1": f"{idx:040x}", "deploment_name": f"app{idx}.ear", "context_root": f"/app{idx}", "roles": ["user"]}
+        for idx in range(deployments)
+    ]
+
+    return ret
+
+
+def mutate_snapshot(snapshot: dict, changes: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    ret = copy.deepcopy(snapshot)
+    packages = ret["system_info"]["packages"]
+
+    for idx in rnd.sample(range(len(packages)), changes):
+        packages[idx]["version"] = "2.0-1.el7"
+
+    del packages[0]
+    packages.append({"pkg_name": "new-pkg.x86_64", "version": "1.0-1.el7", "repository": "@epel"})
+    ret["system_info"]["mounts"][0]["size_available"] += 1
+
+    return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# Snapshot fixtures
+#/----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,143 @@
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import sys
+import tempfile
+import timeit
+import traceback
+
+SCALES = {
+    "small": {
+        "packages": 300, "deployments": 3, "changes": 5, "hosts": 10,
+        "wars": 2, "jars_per_war": 3, "files_per_jar": 10,
+        "datasources": 20, "logrotate_files": 20,
+        "interfaces": 4, "mounts": 8, "devices": 4,
+    },
+    "medium": {
+        "packages": 1500, "deployments": 10, "changes": 20, "hosts": 50,
+        "wars": 4, "jars_per_war": 10, "files_per_jar": 30,
+        "datasources": 100, "logrotate_files": 80,
+        "interfaces": 16, "mounts": 32, "devices": 16,
+    },
+    "large": {
+        "packages": 5000, "deployments": 30, "changes": 100, "hosts": 200,
+        "wars": 8, "jars_per_war": 30, "files_per_jar": 50,
+        "datasources": 500, "logrotate_files": 300,
+        "interfaces": 64, "mounts": 128, "devices": 64,
+    },
+}
+
+
+def collect_benchmarks(args, work_dir: str) -> tuple:
+    # a group whose dependencies are missing is reported as skipped, the others still run
+    ret = []
+    skipped = []
+    scale = SCALES[args.scale]
+
+    groups = [
+        ("bench_modules", "get_wildfly_benchmarks", (scale, work_dir)),
+        ("bench_modules", "get_system_benchmarks", (scale, work_dir)),
+        ("bench_pipeline", "get_gatherer_benchmarks", (scale,)),
+        ("bench_pipeline", "get_diff_benchmarks", (scale,)),
+        ("bench_pipeline", "get_store_benchmarks", (scale, args.mongo_host, args.mongo_port)),
+    ]
+
+    for module_name, function_name, function_args in groups:
+        try:
+            module = importlib.import_module(module_name)
+            ret.extend(getattr(module, function_name)(*function_args))
+        except Exception as e:
+            reason = "".join(traceback.format_exception_only(type(e), e)).strip()
+            skipped.append({"group": f"{module_name}.{function_name}", "reason": reason})
+
+    if args.filter:
+        ret = [benchmark for benchmark in ret if any(name in benchmark[0] for name in args.filter)]
+
+    return ret, skipped
+
+
+def run_benchmark(func, repeat: int, number: int) -> dict:
+    timings = [timing / number for timing in timeit.repeat(func, number=number, repeat=repeat)]
+
+    ret = {}
+    ret["min_s"] = min(timings)
+    ret["mean_s"] = sum(timings) / len(timings)
+    ret["max_s"] = max(timings)
+    return ret
+
+
+def compare_with_baseline(results: list, baseline_path: str, threshold: float) -> None:
+    # min timings are compared, they are the least sensitive to noise
+    with open(baseline_path) as baseline_file:
+        baseline = {result["name"]: result for result in json.load(baseline_file)["results"]}
+
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous is None or previous["params"] != result["params"] or not previous["min_s"]:
+            continue
+
+        result["baseline_min_s"] = previous["min_s"]
+        result["ratio"] = result["min_s"] / previous["min_s"]
+        result["regression"] = result["ratio"] > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the gather, store and diff pipeline on synthetic fixtures")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="medium")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=1)
+    parser.add_argument("--filter", nargs="*", help="only the benchmarks whose name contains one of these strings")
+    parser.add_argument("--mongo-host", help="local mongod to store into, mongomock is used when not given")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio flagged as a regression")
+    parser.add_argument("--output", help="file the JSON results are written to, stdout when not given")
+    args = parser.parse_args()
+
+    report = {}
+    report["metadata"] = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "number": args.number,
+    }
+    report["results"] = []
+
+    with tempfile.TemporaryDirectory(prefix="sniffer_bench_") as work_dir:
+        benchmarks, report["skipped"] = collect_benchmarks(args, work_dir)
+
+        # a failing benchmark is reported as skipped, the report is written with the others
+        for name, params, func in benchmarks:
+            try:
+                timings = run_benchmark(func, args.repeat, args.number)
+            except Exception as e:
+                reason = "".join(traceback.format_exception_only(type(e), e)).strip()
+                report["skipped"].append({"benchmark": name, "reason": reason})
+                print(f"{name}: failed, {reason}", file=sys.stderr)
+                continue
+
+            result = {"name": name, "params": params}
+            result.update(timings)
+            report["results"].append(result)
+            print(f"{name}: {result['min_s']:.6f}s", file=sys.stderr)
+
+    if args.baseline:
+        compare_with_baseline(report["results"], args.baseline, args.threshold)
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if any(result.get("regression") for result in report["results"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,46 @@
 import json
 import os
+import resource
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from enum import Enum
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Union
 
 import yaml
 
+from ansible_module_utils.sniffer_io import PhaseTimer
+from deployment_cache import DEPLOYMENT_ANALYSIS_KEYS, DeploymentCache
+from inventory import Inventory
+from packages import expand_packages
+from playbook_output import read_playbook_results
+from snapshot_sections import SECTION_HASHES_KEY, TIMINGS_KEY, compute_section_hashes
+
 CURR_DIR_PATH = os.path.abspath(os.path.dirname(__file__))
 ANSIBLE_MODULES_PATH = os.path.join(CURR_DIR_PATH, "ansible_modules")
+ANSIBLE_MODULE_UTILS_PATH = os.path.join(CURR_DIR_PATH, "ansible_module_utils")
 ANSIBLE_USER = "giuseppe.daquanno"
+FLEET_MAX_WORKERS = 16
+TIMED_MODULES = ["gatherer", "system_info", "wildfly_info"]
+SLOWEST_ENTRIES = 10
+# facts kept from gather_facts, besides the ones of each network interface
+FACT_KEYS = [
+    "ansible_distribution", "ansible_distribution_release", "ansible_distribution_version",
+    "ansible_architecture", "ansible_processor", "ansible_processor_cores", "ansible_processor_count",
+    "ansible_processor_nproc", "ansible_processor_threads_per_core", "ansible_processor_vcpus",
+    "ansible_memory_mb",
+    "ansible_devices",
+    "ansible_mounts",
+    "ansible_all_ipv4_addresses", "ansible_default_ipv4",
+    "ansible_all_ipv6_addresses", "ansible_default_ipv6",
+    "ansible_dns", "ansible_domain", "ansible_fqdn", "ansible_hostname",
+]
+# fact collectors providing FACT_KEYS and the interfaces, the others are not run on the hosts
+FACT_SUBSETS = ["!all", "!min", "distribution", "dns", "platform", "hardware", "network"]
+MODULE_RESULT_KEYS = ["ansible_facts", "system_info", "wildfly_info"]
                 
 
 class AnsibleGatherer:
@@ -18,58 +51,265 @@ class AnsibleGatherer:
         JBOSS = 2
 
 
-    def __init__(self, inventory_file_path: str):
+    GROUP_SERVER_TYPES = {
+        "wildfly_servers": ServerType.WILDFLY,
+        "jboss_servers": ServerType.JBOSS,
+    }
+
+
+    def __init__(self, inventory_file_path: str, deployment_cache: DeploymentCache=None, timings: bool=False,
+                 module_timeout: int=None, host_timeout: int=None, deployment_workers: int=0, deployment_memory_mb: int=0):
         self.inventory_file_path = inventory_file_path
+        self.inventory = Inventory(inventory_file_path)
+        self.deployment_cache = deployment_cache
+        self.timings = timings
+        # seconds allowed to each module task and to each whole ansible-playbook run, None waits forever
+        self.module_timeout = module_timeout
+        self.host_timeout = host_timeout
+        # processes and address space in MB of each one used by wildfly_info to analyse deployments, 0 keeps the module defaults
+        self.deployment_workers = deployment_workers
+        self.deployment_memory_mb = deployment_memory_mb
+
+    
+    def get_server_names(self) -> List[str]:
+        return self.inventory.get_server_names()
+
+
+    def gather_server_info(self, server_name: str, previous_info: dict=None) -> dict:
+        previous_infos = {server_name: previous_info} if previous_info else None
+        server_info = self.gather_group_info([server_name], previous_infos)[server_name]
+
+        if isinstance(server_info, Exception):
+            raise server_info
+
+        return server_info
+
+
+    def gather_group_info(self, server_names: List[str], previous_infos: Dict[str, dict]=None) -> Dict[str, Union[dict, Exception]]:
+        # all modules for all the given hosts are executed by a single ansible-playbook run
+        previous_infos = previous_infos or {}
+        self._seed_deployment_cache(previous_infos)
+
+        # other groups may be gathered by the threads of this process, only the playbook run itself is accounted
+        group_timer = PhaseTimer(self.timings, per_thread=True)
+        start = time.perf_counter()
+        module_results, usage = self.__exec_playbook(server_names, previous_infos)
+        group_timer.add_rusage("exec_playbook", time.perf_counter() - start, usage)
+
+        return self._build_group_info(server_names, module_results, previous_infos, group_timer)
+
+
+    def gather_fleet(self, server_names: Iterable[str], max_workers: int=FLEET_MAX_WORKERS,
+                     previous_infos: Dict[str, dict]=None) -> Iterator[Tuple[str, Union[dict, Exception]]]:
+        # results are yielded as soon as each host completes, failures are yielded instead of raised
+        previous_infos = previous_infos or {}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {
+            executor.submit(self.gather_server_info, server_name, previous_infos.get(server_name)): server_name
+            for server_name in server_names
+        }
+
+        try:
+            for future in as_completed(futures):
+                server_name = futures[future]
+                try:
+                    yield server_name, future.result()
+                except Exception as e:
+                    yield server_name, e
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+    def summarize_timings(self, server_infos: Dict[str, dict]) -> dict:
+        # fleet-wide view of the timings of each phase, with the slowest hosts and deployments
+        ret = {"phases": {}, "slowest_hosts": [], "slowest_deployments": []}
+        hosts = []
+        deployments = []
+
+        for server_name, server_info in server_infos.items():
+            if not isinstance(server_info, dict) or not server_info.get(TIMINGS_KEY):
+                continue
+
+            host_entry = {"server_name": server_name, "remote_wall_s": 0.0}
+            for module_name in TIMED_MODULES:
+                module_timings = server_info[TIMINGS_KEY].get(module_name) or {}
+
+                for phase_name, phase in (module_timings.get("phases") or {}).items():
+                    self.__add_phase_timings(ret["phases"], f"{module_name}.{phase_name}", server_name, phase)
+
+                total = module_timings.get("total") or {}
+                host_entry[f"{module_name}_wall_s"] = total.get("wall_s")
+                host_entry[f"{module_name}_peak_rss_kb"] = total.get("peak_rss_kb")
+                if module_name != "gatherer":
+                    host_entry["remote_wall_s"] += total.get("wall_s") or 0.0
+
+                for sha1, deployment in (module_timings.get("deployments") or {}).items():
+                    total = deployment.get("total") or {}
+                    deployments.append({"server_name": server_name, "sha1": sha1, "wall_s": total.get("wall_s", 0.0),
+                                        "bytes_read": total.get("bytes_read", 0)})
+
+            hosts.append(host_entry)
+
+        for phase in ret["phases"].values():
+            phase["mean_wall_s"] = phase["wall_s"] / phase["hosts"]
+
+        # hosts are ranked by the time spent in the remote modules, the playbook run is shared by a whole group
+        ret["slowest_hosts"] = sorted(hosts, key=lambda host_entry: host_entry["remote_wall_s"], reverse=True)[:SLOWEST_ENTRIES]
+        ret["slowest_deployments"] = sorted(deployments, key=lambda deployment: deployment["wall_s"], reverse=True)[:SLOWEST_ENTRIES]
+
+        return ret
 
     
-    def get_server_names(self):
-        server_names = set()
-        
-        with open(self.inventory_file_path) as inventory_file:
-            inventory = yaml.safe_load(inventory_file)
+    def _seed_deployment_cache(self, previous_infos: Dict[str, dict]) -> None:
+        # the single underscore helpers are shared with AsyncAnsibleGatherer, which only replaces the subprocess handling
+        if self.deployment_cache is not None:
+            for previous_info in previous_infos.values():
+                self.deployment_cache.update(((previous_info or {}).get("wildfly_info") or {}).get("deployments") or [])
 
-        for server_type in inventory["all"]["children"].keys():
-            hosts = inventory["all"]["children"][server_type]["hosts"].keys()
-            for host in hosts:
-                server_names.add(host)
 
-        return sorted(list(server_names))
+    def _build_group_info(self, server_names: List[str], module_results: Dict[str, Dict[str, dict]],
+                          previous_infos: Dict[str, dict], group_timer: PhaseTimer) -> Dict[str, Union[dict, Exception]]:
+        # the playbook run is shared by the group, its timings are reported for each host
+        ret = {}
+
+        for server_name in server_names:
+            timer = PhaseTimer(self.timings, per_thread=True)
+            try:
+                previous_info = previous_infos.get(server_name) or {}
+                with timer.phase("build_server_info"):
+                    ret[server_name] = self.__build_server_info(server_name, module_results.get(server_name, {}), previous_info)
+            except Exception as e:
+                ret[server_name] = e
+                continue
+
+            if self.timings:
+                timer.add("exec_playbook", dict(group_timer.phases["exec_playbook"], hosts=len(server_names)))
+                ret[server_name][TIMINGS_KEY]["gatherer"] = timer.get_timings()
+
+        return ret
+
+
+    def _prepare_playbook_run(self, tmp_dir: str, server_names: List[str], previous_infos: Dict[str, dict]) -> Tuple[List[str], dict]:
+        playbook_path = os.path.join(tmp_dir, "server_sniffer.yml")
+        with open(playbook_path, "w") as playbook_file:
+            yaml.safe_dump(self.__build_playbook(), playbook_file)
+
+        extra_vars_path = os.path.join(tmp_dir, "extra_vars.json")
+        with open(extra_vars_path, "w") as extra_vars_file:
+            json.dump(self.__build_extra_vars(previous_infos), extra_vars_file)
+
+        cmd = [
+            "ansible-playbook", "-i", self.inventory_file_path, "-u", ANSIBLE_USER, "-M", ANSIBLE_MODULES_PATH,
+            "-l", ",".join(server_names), "-e", f"@{extra_vars_path}", playbook_path
+        ]
+        env = dict(os.environ, ANSIBLE_STDOUT_CALLBACK="json", ANSIBLE_MODULE_UTILS=ANSIBLE_MODULE_UTILS_PATH)
+
+        return cmd, env
+
+
+    def _read_playbook_output(self, cmd: List[str], stdout: BinaryIO, stderr_path: str) -> Dict[str, Dict[str, dict]]:
+        # stdout is decoded while ansible-playbook writes it, stderr goes to a file so that it never blocks the run
+        try:
+            return read_playbook_results(stdout, MODULE_RESULT_KEYS, FACT_KEYS)
+        except Exception:
+            raise self._get_playbook_error(cmd, stderr_path)
 
 
-    def gather_server_info(self, server_name: str) -> dict:
+    def _get_playbook_error(self, cmd: List[str], stderr_path: str) -> Exception:
+        with open(stderr_path, "rb") as stderr_file:
+            err = stderr_file.read().decode("utf-8", errors="replace")
+        return Exception(f"Failed to execute ansible command: {' '.join(cmd)}\nstderr: {err}")
+
+
+    def _wait_playbook_run(self, process: subprocess.Popen) -> resource.struct_rusage:
+        # waited for with wait4 rather than Popen.wait, for the resource usage of this run alone
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        return usage
+
+
+    def _kill_playbook_run(self, pid: int) -> None:
+        # the run has a session of its own, the ssh connections spawned by ansible are killed with it
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+    def __build_server_info(self, server_name: str, module_results: Dict[str, dict], previous_info: dict) -> dict:
         server_info = {}
         server_types = self.__get_server_types(server_name)
 
         ansible_module = "gather_facts"
-        ansible_facts = self.__exec_ansible(server_name, ansible_module)["ansible_facts"]
+        ansible_facts = self.__get_module_result(server_name, module_results, ansible_module)["ansible_facts"]
         server_info["system_info"] = self.__fix_ansible_facts(ansible_facts)
 
         ansible_module = "system_info"
-        server_info["system_info"].update(self.__exec_ansible(server_name, ansible_module, True)["system_info"])
+        server_info["system_info"].update(self.__get_module_result(server_name, module_results, ansible_module)["system_info"])
+        if isinstance(server_info["system_info"].get("packages"), dict):
+            server_info["system_info"]["packages"] = expand_packages(server_info["system_info"]["packages"])
+        self.__reuse_unchanged(server_info["system_info"], previous_info.get("system_info") or {})
 
         if self.ServerType.WILDFLY in server_types:
             ansible_module = "wildfly_info"
-            server_info["wildfly_info"] = self.__exec_ansible(server_name, ansible_module, True)['wildfly_info']
+            server_info["wildfly_info"] = self.__get_module_result(server_name, module_results, ansible_module)["wildfly_info"]
+            self.__reuse_unchanged(server_info["wildfly_info"], previous_info.get("wildfly_info") or {})
+            self.__resolve_cached_deployments(server_info["wildfly_info"])
+
+        # timings of the remote modules are moved out of the sections they describe
+        if self.timings:
+            server_info[TIMINGS_KEY] = {
+                module_name: server_info[module_name].pop(TIMINGS_KEY, None)
+                for module_name in ("system_info", "wildfly_info") if module_name in server_info
+            }
+
+        server_info[SECTION_HASHES_KEY] = compute_section_hashes(server_info)
 
         return server_info
 
-    
+
+    def __reuse_unchanged(self, module_info: dict, previous_module_info: dict) -> None:
+        # sections skipped by the remote modules are taken from the previous snapshot
+        for key in module_info.pop("unchanged", []):
+            module_info[key] = previous_module_info.get(key)
+
+
+    def __resolve_cached_deployments(self, wildfly_info: dict) -> None:
+        # deployments whose sha1 is known to the controller are returned by the module without analysis
+        deployments = wildfly_info.get("deployments") or []
+        analysed_deployments = [deployment for deployment in deployments if not deployment.get("cached")]
+
+        for deployment in deployments:
+            if deployment.pop("cached", False):
+                cache_entry = self.deployment_cache.get(deployment["sha1"]) if self.deployment_cache is not None else None
+                deployment.update(cache_entry or {key: None for key in DEPLOYMENT_ANALYSIS_KEYS})
+
+        if self.deployment_cache is not None:
+            self.deployment_cache.update(analysed_deployments)
+
+
+    def __add_phase_timings(self, phases: dict, phase_name: str, server_name: str, phase: dict) -> None:
+        entry = phases.setdefault(phase_name, {
+            "hosts": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes_read": 0, "subprocesses": 0,
+            "max_wall_s": 0.0, "slowest_host": None, "peak_rss_kb": 0,
+        })
+
+        entry["hosts"] += 1
+        for key in ("wall_s", "cpu_s", "bytes_read", "subprocesses"):
+            entry[key] += phase.get(key, 0)
+        entry["peak_rss_kb"] = max(entry["peak_rss_kb"], phase.get("peak_rss_kb", 0))
+
+        if phase.get("wall_s", 0.0) >= entry["max_wall_s"]:
+            entry["max_wall_s"] = phase.get("wall_s", 0.0)
+            entry["slowest_host"] = server_name
+
+
     def __fix_ansible_facts(self, ansible_facts: dict) -> dict:
         ret = {}
-        
-        keys = [
-            "ansible_distribution", "ansible_distribution_release", "ansible_distribution_version",
-            "ansible_architecture", "ansible_processor", "ansible_processor_cores", "ansible_processor_count",
-            "ansible_processor_nproc", "ansible_processor_threads_per_core", "ansible_processor_vcpus",
-            "ansible_memory_mb",
-            "ansible_devices",
-            "ansible_mounts",
-            "ansible_all_ipv4_addresses", "ansible_default_ipv4",
-            "ansible_all_ipv6_addresses", "ansible_default_ipv6",
-            "ansible_dns", "ansible_domain", "ansible_fqdn", "ansible_hostname",
-        ]
 
-        for key in keys:
+        for key in FACT_KEYS:
             fixed_key = key.replace("ansible_", "")
             ret[fixed_key] = ansible_facts[key]
 
@@ -86,44 +326,97 @@ class AnsibleGatherer:
 
 
     def __get_server_types(self, server_name: str) -> set:
-        server_types = set()
+        server_groups = self.inventory.get_groups(server_name)
+        return {server_type for group, server_type in self.GROUP_SERVER_TYPES.items() if group in server_groups}
+
+
+    def __build_playbook(self) -> List[dict]:
+        # task names are used to demultiplex the results of each module
+        # previous fingerprints are looked up by host in the extra vars file
+        fingerprints_var = "{{{{ sniffer_fingerprints.get(inventory_hostname, {{}}).get('{}', {{}}) }}}}"
+        tasks = [
+            {"name": "gather_facts", "setup": {"gather_subset": FACT_SUBSETS}, "ignore_errors": True},
+            {
+                "name": "system_info", "ignore_errors": True,
+                "system_info": {"fingerprints": fingerprints_var.format("system_info"), "timings": self.timings},
+            },
+            {
+                "name": "wildfly_info", "ignore_errors": True, "when": "'wildfly_servers' in group_names",
+                "wildfly_info": {
+                    "fingerprints": fingerprints_var.format("wildfly_info"),
+                    "known_deployments": "{{ sniffer_known_deployments }}",
+                    "max_workers": self.deployment_workers,
+                    "max_memory_mb": self.deployment_memory_mb,
+                    "timings": self.timings,
+                },
+            },
+        ]
 
-        with open(self.inventory_file_path) as inventory_file:
-            inventory = yaml.safe_load(inventory_file)
+        # a module running past its deadline fails its task only, the other modules still report
+        if self.module_timeout:
+            for task in tasks:
+                task["timeout"] = self.module_timeout
 
-        for server_type in inventory["all"]["children"].keys():
-            hosts = inventory["all"]["children"][server_type]["hosts"].keys()
-                
-            if server_name in hosts and server_type == "wildfly_servers":
-                server_types.add(self.ServerType.WILDFLY)
-            elif server_name in hosts and server_type == "jboss_servers":
-                server_types.add(self.ServerType.JBOSS)
+        return [{"hosts": "all", "gather_facts": False, "tasks": tasks}]
 
-        return server_types
 
+    def __build_extra_vars(self, previous_infos: Dict[str, dict]) -> dict:
+        fingerprints = {}
 
-    def __exec_ansible(self, server_name: str, module_name: str, custom_module_path: bool=False) -> dict:
-        cmd = f"ansible -i {self.inventory_file_path} -m {module_name} -u {ANSIBLE_USER} {server_name}"
+        for server_name, previous_info in previous_infos.items():
+            if previous_info:
+                fingerprints[server_name] = {
+                    module_name: (previous_info.get(module_name) or {}).get("fingerprints", {})
+                    for module_name in ("system_info", "wildfly_info")
+                }
 
-        if custom_module_path:
-            cmd += f" -M {ANSIBLE_MODULES_PATH}"
+        known_deployments = self.deployment_cache.get_known_sha1s() if self.deployment_cache is not None else []
 
-        ret = subprocess.run(cmd, capture_output=True, shell=True)
-        out = ret.stdout.decode("utf-8")
-        err = ret.stderr.decode("utf-8")
-        err_string = f"\nstdout: {out}\nstderr: {err}"
+        return {"sniffer_fingerprints": fingerprints, "sniffer_known_deployments": known_deployments}
 
-        if err:
-            raise Exception(f"Failed to execute ansible command: {cmd}" + err_string)
 
-        json_start_index = out.find("{")
+    def __exec_playbook(self, server_names: List[str], previous_infos: Dict[str, dict]) -> Tuple[Dict[str, Dict[str, dict]], resource.struct_rusage]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cmd, env = self._prepare_playbook_run(tmp_dir, server_names, previous_infos)
+            stderr_path = os.path.join(tmp_dir, "stderr.log")
 
-        try:
-            json_data = json.loads(out[json_start_index:])
-        except:
-            raise Exception(f"Failed to load valid JSON from: \n{out}")
+            with open(stderr_path, "wb") as stderr_file:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, env=env, start_new_session=True)
+
+            # the deadline kills the run, which ends the output being read
+            expired = threading.Event()
+
+            def expire():
+                expired.set()
+                self._kill_playbook_run(process.pid)
+
+            deadline = threading.Timer(self.host_timeout, expire) if self.host_timeout else None
+            if deadline is not None:
+                deadline.start()
+
+            try:
+                with process.stdout:
+                    module_results = self._read_playbook_output(cmd, process.stdout, stderr_path)
+            except Exception:
+                self._kill_playbook_run(process.pid)
+                if expired.is_set():
+                    raise Exception(f"Timed out after {self.host_timeout}s executing ansible command: {' '.join(cmd)}")
+                raise
+            finally:
+                if deadline is not None:
+                    deadline.cancel()
+                usage = self._wait_playbook_run(process)
+
+        return module_results, usage
+
+
+    def __get_module_result(self, server_name: str, module_results: Dict[str, dict], module_name: str) -> dict:
+        if module_name not in module_results:
+            raise Exception(f"No result for ansible module {module_name} on {server_name}")
+
+        result = module_results[module_name]
 
-        if "msg" in json_data:
-            raise Exception(f"Failed to execute ansible module {module_name}: {json_data['msg']}" + err_string)
+        if result.get("unreachable") or result.get("failed"):
+            raise Exception(f"Failed to execute ansible module {module_name} on {server_name}: {result.get('msg')}")
 
-        return json_data
+        return result
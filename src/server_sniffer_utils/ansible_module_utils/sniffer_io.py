@@ -0,0 +1,225 @@
+# Copyright: (c) 2022, Giuseppe D' Aquanno <GiuDaquan@gmail.com>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import mmap
+import os
+import re
+import resource
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+MMAP_THRESHOLD = 1024 * 1024
+# process wide counters sampled by PhaseTimer
+IO_COUNTERS = {"bytes_read": 0, "subprocesses": 0}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# File access
+# ----------------------------------------------------------------------------------------------------------------------
+def read_text(file_path: str) -> str:
+    with open(file_path, "rb") as file:
+        content = file.read()
+
+    count_bytes_read(len(content))
+    return content.decode("utf-8", errors="replace")
+
+
+def read_lines(file_path: str) -> List[str]:
+    return [line for line in read_text(file_path).split("\n") if line]
+
+
+def list_files(dir_path: str) -> List[Tuple[str, str]]:
+    # (name, path) of the regular files in dir_path, sorted by name
+    with os.scandir(dir_path) as entries:
+        return sorted((entry.name, entry.path) for entry in entries if entry.is_file())
+
+
+def list_dirs(dir_path: str) -> List[Tuple[str, str]]:
+    with os.scandir(dir_path) as entries:
+        return sorted((entry.name, entry.path) for entry in entries if entry.is_dir())
+
+
+def walk_files(dir_path: str, extensions: Tuple[str, ...]=()) -> Iterator[str]:
+    dirs = [dir_path]
+
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.is_file() and (not extensions or entry.name.endswith(extensions)):
+                    yield entry.path
+
+
+def search_file(file_path: str, patterns: "MultiPattern") -> Dict[str, str]:
+    # large files are searched through a read-only memory map instead of being read in memory
+    with open(file_path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        count_bytes_read(file_size)
+
+        if file_size < MMAP_THRESHOLD:
+            return patterns.search(file.read())
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return patterns.search(mapped_file)
+
+
+def count_bytes_read(size: int) -> None:
+    IO_COUNTERS["bytes_read"] += size
+
+
+def run_command(cmd: List[str]) -> bytes:
+    IO_COUNTERS["subprocesses"] += 1
+    return subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+#/----------------------------------------------------------------------------------------------------------------------
+# File access
+#/----------------------------------------------------------------------------------------------------------------------
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Pattern matching
+# ----------------------------------------------------------------------------------------------------------------------
+class MultiPattern:
+
+
+    def __init__(self, patterns: Dict[str, str], flags: int=0):
+        # all the patterns are joined in a single alternation so that each input is scanned once,
+        # patterns are expected not to overlap each other
+        self.patterns = {name: re.compile(pattern.encode("utf-8"), flags) for name, pattern in patterns.items()}
+        alternatives = [b"(?P<" + name.encode("utf-8") + b">" + regex.pattern + b")" for name, regex in self.patterns.items()]
+        self.combined = re.compile(b"|".join(alternatives), flags)
+
+
+    def search(self, data: Union[bytes, str, mmap.mmap]) -> Dict[str, str]:
+        # first match of each pattern, reported as its first group when the pattern has one
+        ret = {}
+        data = data.encode("utf-8") if isinstance(data, str) else data
+
+        for match in self.combined.finditer(data):
+            name = match.lastgroup
+            if name in ret:
+                continue
+
+            pattern_match = self.patterns[name].match(data, match.start())
+            value = pattern_match.group(1) if self.patterns[name].groups else pattern_match.group(0)
+            ret[name] = (value or b"").decode("utf-8", errors="replace")
+
+            if len(ret) == len(self.patterns):
+                break
+
+        return ret
+#/----------------------------------------------------------------------------------------------------------------------
+# Pattern matching
+#/----------------------------------------------------------------------------------------------------------------------
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Instrumentation
+# ----------------------------------------------------------------------------------------------------------------------
+class PhaseTimer:
+
+
+    def __init__(self, enabled: bool=False, per_thread: bool=False):
+        # a disabled timer costs nothing, phases are just executed
+        # a per thread timer only measures the cpu time of the calling thread, for work sharing a process with other hosts
+        self.enabled = enabled
+        self.per_thread = per_thread
+        self.phases = {}
+        self.items = {}
+        self.__start = self.__sample() if enabled else None
+
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        start = self.__sample()
+        try:
+            yield
+        finally:
+            self.add(name, self.__delta(start, self.__sample()))
+
+
+    def add_rusage(self, name: str, wall_s: float, usage: resource.struct_rusage) -> None:
+        # a child process waited for with os.wait4, its usage includes the processes it waited for
+        if not self.enabled:
+            return
+
+        entry = {}
+        entry["wall_s"] = round(wall_s, 6)
+        entry["cpu_s"] = round(usage.ru_utime + usage.ru_stime, 6)
+        entry["subprocesses"] = 1
+        entry["peak_rss_kb"] = usage.ru_maxrss
+        self.add(name, entry)
+
+
+    def add(self, name: str, entry: dict, group: str=None) -> None:
+        # repeated phases are accumulated, the peak rss is a high-water mark
+        entries = self.phases if group is None else self.items.setdefault(group, {})
+
+        if name not in entries:
+            entries[name] = dict(entry, calls=1)
+            return
+
+        accumulated = entries[name]
+        for key, value in entry.items():
+            if key == "peak_rss_kb":
+                accumulated[key] = max(accumulated.get(key, 0), value)
+            elif isinstance(value, float):
+                accumulated[key] = round(accumulated.get(key, 0.0) + value, 6)
+            elif isinstance(value, int):
+                accumulated[key] = accumulated.get(key, 0) + value
+        accumulated["calls"] += 1
+
+
+    def get_timings(self) -> dict:
+        ret = {}
+        ret["phases"] = self.phases
+        ret["total"] = self.__delta(self.__start, self.__sample()) if self.enabled else None
+        ret.update(self.items)
+        return ret
+
+
+    def __sample(self) -> dict:
+        ret = {}
+        ret["wall_s"] = time.perf_counter()
+        ret["bytes_read"] = IO_COUNTERS["bytes_read"]
+        ret["subprocesses"] = IO_COUNTERS["subprocesses"]
+
+        # the peak rss of a thread can't be told apart from the one of its process, it is left out
+        if self.per_thread:
+            ret["cpu_s"] = time.thread_time()
+            return ret
+
+        # cpu time and peak rss of the worker processes are included once they have been waited for
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        ret["cpu_s"] = usage.ru_utime + usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+        ret["peak_rss_kb"] = max(usage.ru_maxrss, children_usage.ru_maxrss)
+        return ret
+
+
+    def __delta(self, start: dict, end: dict) -> dict:
+        ret = {key: end[key] - start[key] for key in ("wall_s", "cpu_s", "bytes_read", "subprocesses")}
+        ret["wall_s"] = round(ret["wall_s"], 6)
+        ret["cpu_s"] = round(ret["cpu_s"], 6)
+        if "peak_rss_kb" in end:
+            ret["peak_rss_kb"] = end["peak_rss_kb"]
+        return ret
+
+
+def measure_call(func: Callable, *args) -> Tuple[object, dict]:
+    # for work done in other processes: the result travels back together with the timings of the call
+    timer = PhaseTimer(enabled=True)
+    result = func(*args, timer)
+    return result, timer.get_timings()
+#/----------------------------------------------------------------------------------------------------------------------
+# Instrumentation
+#/----------------------------------------------------------------------------------------------------------------------
@@ -19,16 +19,18 @@ version_added: "1.0.0"
 description: This is my longer description explaining my test module.
 
 options:
-    name:
-        description: This is the message to send to the test module.
-        required: true
-        type: str
-    new:
+    fingerprints:
         description:
-            - Control to demo if the result of this module is changed or not.
-            - Parameter description can be a list as well.
+            - Fingerprints returned by the previous run of the module.
+            - Sections whose fingerprint did not change are not gathered and are listed in C(unchanged).
+        required: false
+        type: dict
+    timings:
+        description:
+            - Record wall and CPU time, bytes read, subprocesses and peak RSS of each phase in C(_timings).
         required: false
         type: bool
+        default: false
 
 author:
     - Giuseppe D"Aquanno (@GiuDaquan)
@@ -66,19 +68,42 @@ message:
     sample: "goodbye"
 """
 
+import hashlib
+import json
 import os
 import re
-import subprocess
-from asyncio.subprocess import PIPE
+import sqlite3
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.sniffer_io import PhaseTimer, list_dirs, list_files, read_text, run_command
+
+LOGROTATE_CONF_DIR = "/etc/logrotate.d"
+RPMDB_DIR = "/var/lib/rpm"
+# BerkeleyDB on yum hosts, sqlite on recent dnf ones, the __db.* environment files are rewritten by plain reads
+RPMDB_FILES = ["Packages", "rpmdb.sqlite"]
+YUMDB_DIR = "/var/lib/yum/yumdb"
+DNF_HISTORY_DB = "/var/lib/dnf/history.sqlite"
+# done transaction items only, without the ones of packages leaving the system or replaced by a reinstall:
+# downgraded (3), obsoleted (5), upgraded (7), removed (8) and reinstalled (10)
+DNF_HISTORY_QUERY = """
+    SELECT rpm.name, rpm.version, rpm.release, rpm.arch, repo.repoid
+    FROM trans_item
+    JOIN rpm USING (item_id)
+    JOIN repo ON trans_item.repo_id = repo.id
+    WHERE trans_item.action NOT IN (3, 5, 7, 8, 10) AND trans_item.state = 1
+    ORDER BY trans_item.id
+"""
+DNF_REPOQUERY_FORMAT = "%{name}-%{version}-%{release}-%{arch}\t%{from_repo}\n"
+PACKAGES_CACHE_PATH = "/var/tmp/server_sniffer/packages.json"
+PACKAGE_COLUMNS = ["name", "epoch", "version", "release", "arch"]
+RPM_QUERY_FORMAT = "%{NAME}\t%{EPOCH}\t%{VERSION}\t%{RELEASE}\t%{ARCH}\n"
 
 
 def run_module():
     # define available arguments/parameters a user can pass to the module
     module_args = dict(
-    #    name=dict(type="str", required=True),
-    #    new=dict(type="bool", required=False, default=False)
+        fingerprints=dict(type="dict", required=False, default={}),
+        timings=dict(type="bool", required=False, default=False),
     )
 
     result = dict(changed=False, system_info={})
@@ -90,21 +115,38 @@ def run_module():
 
     system_info = result["system_info"]
     system_info["errors"] = []
+    timer = PhaseTimer(module.params["timings"])
+
+    # sections whose fingerprint matches the previous one are not gathered again
+    with timer.phase("fingerprints"):
+        fingerprints = get_fingerprints()
+    previous_fingerprints = module.params["fingerprints"]
+    unchanged = [section for section, fp in fingerprints.items() if fp and previous_fingerprints.get(section) == fp]
+    system_info["fingerprints"] = fingerprints
+    system_info["unchanged"] = unchanged
 
     # get system information
-    try:
-        system_info["logrotate_configuration"] = get_logrotate_info()
-    except Exception as e:
-        system_info["logrotate_configuration"] = None
-        system_info["errors"].append(f"logrotate_conf: {str(e)}")
+    if "logrotate_configuration" not in unchanged:
+        try:
+            with timer.phase("logrotate_configuration"):
+                system_info["logrotate_configuration"] = get_logrotate_info()
+        except Exception as e:
+            system_info["logrotate_configuration"] = None
+            system_info["errors"].append(f"logrotate_conf: {str(e)}")
+            fingerprints.pop("logrotate_configuration")
+
+    if "packages" not in unchanged:
+        try:
+            with timer.phase("packages"):
+                system_info["packages"] = get_pkg_list()
+        except Exception as e:
+            system_info["packages"] = None
+            system_info["errors"].append(f"packages: {str(e)}")
+            fingerprints.pop("packages")
+
+    if timer.enabled:
+        system_info["_timings"] = timer.get_timings()
 
-    try:
-        system_info["packages"] = get_pkg_list()
-    except Exception as e:
-        system_info["packages"] = None
-        system_info["errors"].append(f"packages: {str(e)}")
-        
-   
     module.exit_json(**result)
 
 
@@ -112,18 +154,59 @@ def main():
     run_module()
 
 
+def get_fingerprints():
+    ret = {}
+
+    try:
+        ret["logrotate_configuration"] = get_dir_fingerprint(LOGROTATE_CONF_DIR)
+    except Exception:
+        ret["logrotate_configuration"] = None
+
+    try:
+        ret["packages"] = get_rpmdb_fingerprint()
+    except Exception:
+        ret["packages"] = None
+
+    return ret
+
+
+def get_dir_fingerprint(dir_path):
+    # cheap fingerprint built from names, sizes and mtimes of the directory entries
+    digest = hashlib.sha1()
+
+    for file, file_path in list_files(dir_path):
+        stat = os.stat(file_path)
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def get_rpmdb_fingerprint():
+    # only the package database itself, it is rewritten on every install, update or removal
+    digest = hashlib.sha1()
+    rpmdb_files = [file for file in RPMDB_FILES if os.path.isfile(os.path.join(RPMDB_DIR, file))]
+
+    if not rpmdb_files:
+        raise Exception(f"No rpm database at {RPMDB_DIR}")
+
+    for file in rpmdb_files:
+        stat = os.stat(os.path.join(RPMDB_DIR, file))
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+
+    return digest.hexdigest()
+
+
 def get_logrotate_info():
     ret = []
-    logrotate_conf_dir = "/etc/logrotate.d"
-    
+    logrotate_conf_dir = LOGROTATE_CONF_DIR
+
     if not os.path.isdir(logrotate_conf_dir):
         raise Exception(f"No Logrotate configuration files at {logrotate_conf_dir}")
 
     conf_regex = re.compile(r"({(.+)})", re.DOTALL)
 
-    for file in os.listdir(logrotate_conf_dir):
-        cat_cmd = f"cat {os.path.join(logrotate_conf_dir, file)}"
-        cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
+    for file, file_path in list_files(logrotate_conf_dir):
+        cat_out = read_text(file_path)
 
         conf = conf_regex.search(cat_out)
         conf_blob = conf.group(1)
@@ -144,30 +227,148 @@ def get_logrotate_info():
     return ret
 
 
-def get_pkg_list():
+def get_pkg_list(cache_path=PACKAGES_CACHE_PATH):
+    # the rpmdb fingerprint changes on every install, update or removal
+    rpmdb_fingerprint = get_rpmdb_fingerprint()
+    cache = load_json(cache_path)
+
+    if cache and cache.get("rpmdb") == rpmdb_fingerprint:
+        return cache["packages"]
+
+    ret = query_rpm_bindings()
+    if ret is None:
+        ret = query_rpm_cli()
+
+    if not ret["name"]:
+        raise Exception("Failed to read rpm package list")
+
+    ret["repository"] = get_pkg_repositories(ret)
+
+    try:
+        save_json(cache_path, {"rpmdb": rpmdb_fingerprint, "packages": ret})
+    except OSError:
+        pass
+
+    return ret
+
+
+def query_rpm_bindings():
+    try:
+        import rpm
+    except ImportError:
+        return None
+
+    ret = {column: [] for column in PACKAGE_COLUMNS}
+    tags = [rpm.RPMTAG_NAME, rpm.RPMTAG_EPOCH, rpm.RPMTAG_VERSION, rpm.RPMTAG_RELEASE, rpm.RPMTAG_ARCH]
+
+    for header in rpm.TransactionSet().dbMatch():
+        for column, tag in zip(PACKAGE_COLUMNS, tags):
+            value = header[tag]
+            value = value.decode("utf-8", errors="replace") if isinstance(value, bytes) else value
+            ret[column].append(str(value) if value is not None else get_missing_value(column))
+
+    return ret
+
+
+def query_rpm_cli():
+    ret = {column: [] for column in PACKAGE_COLUMNS}
+    rpm_cmd = ["rpm", "-qa", "--queryformat", RPM_QUERY_FORMAT]
+    rpm_out = run_command(rpm_cmd).decode("utf-8", errors="replace")
+
+    for line in rpm_out.splitlines():
+        fields = line.split("\t")
+        if len(fields) != len(PACKAGE_COLUMNS):
+            continue
+
+        for column, value in zip(PACKAGE_COLUMNS, fields):
+            ret[column].append(get_missing_value(column) if value == "(none)" else value)
+
+    return ret
+
+
+def get_missing_value(column):
+    # a missing epoch is left out of the version, other missing tags are shown by yum as rpm prints them
+    return None if column == "epoch" else "(none)"
+
+
+def get_pkg_repositories(packages):
+    # yum and dnf record the origin repository of each package, rpm itself does not
+    if os.path.isdir(YUMDB_DIR):
+        repositories = read_yumdb_repositories()
+    else:
+        try:
+            repositories = read_dnf_history_repositories()
+        except sqlite3.Error:
+            repositories = query_dnf_repositories()
+
     ret = []
-    yum_cmd = "yum list installed"
-    yum_out = subprocess.run(yum_cmd, stdout=subprocess.PIPE, shell=True).stdout.decode("utf-8", errors="replace")
+    for name, version, release, arch in zip(packages["name"], packages["version"], packages["release"], packages["arch"]):
+        repository = repositories.get(f"{name}-{version}-{release}-{arch}")
+        ret.append(f"@{repository}" if repository else "installed")
 
-    if "Installed Packages" not in yum_out:
-        raise Exception("Failed to read yum package list")
+    return ret
 
-    yum_out = re.sub(r"\n( +)", r"\g<1>", yum_out)
 
-    lines = yum_out.splitlines()
-    pkg_index = lines.index("Installed Packages") + 1
+def read_yumdb_repositories():
+    ret = {}
 
-    for line in lines[pkg_index:]:
-        pkg_name, pkg_version, pkg_owner = [word for word in line.split(" ") if word]
-        
-        entry = {}
-        entry["pkg_name"] = pkg_name
-        entry["version"] = pkg_version
-        entry["repository"] = pkg_owner
+    for _, letter_dir in list_dirs(YUMDB_DIR):
+        for pkg_dir_name, pkg_dir in list_dirs(letter_dir):
+            from_repo_path = os.path.join(pkg_dir, "from_repo")
+            if os.path.isfile(from_repo_path):
+                # <pkgid>-<name>-<version>-<release>-<arch>
+                ret[pkg_dir_name.split("-", 1)[1]] = read_text(from_repo_path).strip()
 
-        ret.append(entry)
+    return ret
+
+
+def read_dnf_history_repositories():
+    # the repository of the last transaction that brought each package in, as dnf list installed reports it
+    ret = {}
+
+    connection = sqlite3.connect(f"file:{DNF_HISTORY_DB}?mode=ro", uri=True)
+    try:
+        for name, version, release, arch, repoid in connection.execute(DNF_HISTORY_QUERY):
+            ret[f"{name}-{version}-{release}-{arch}"] = repoid
+    finally:
+        connection.close()
+
+    return ret
+
+
+def query_dnf_repositories():
+    # much slower than the history database, only used when it is missing or can not be read
+    ret = {}
+    dnf_cmd = ["dnf", "repoquery", "--installed", "--cacheonly", "--queryformat", DNF_REPOQUERY_FORMAT]
+
+    try:
+        dnf_out = run_command(dnf_cmd).decode("utf-8", errors="replace")
+    except Exception:
+        return ret
+
+    for line in dnf_out.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 2 and fields[1]:
+            ret[fields[0]] = fields[1]
+
+    return ret
+
+
+def load_json(file_path):
+    try:
+        with open(file_path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-    return ret if ret else None
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, file_path)
 
 
 if __name__ == "__main__":
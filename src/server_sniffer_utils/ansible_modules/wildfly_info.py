@@ -17,16 +17,36 @@ version_added: "1.0.0"
 description: This is my longer description explaining my test module.
 
 options:
-    name:
-        description: This is the message to send to the test module.
-        required: true
+    fingerprints:
+        description:
+            - Fingerprints returned by the previous run of the module.
+            - Sections whose fingerprint did not change are not gathered and are listed in C(unchanged).
+        required: false
+        type: dict
+    cache_path:
+        description: Path of the on-host cache of deployment analyses, keyed by deployment sha1.
+        required: false
         type: str
-    new:
+    known_deployments:
+        description: Sha1 of the deployments already analysed by the controller, returned without analysis.
+        required: false
+        type: list
+        elements: str
+    max_workers:
+        description: Number of deployments analysed in parallel, 0 uses half of the available CPUs.
+        required: false
+        type: int
+    max_memory_mb:
+        description: Address space limit of each analysis worker in MB, 0 disables the limit.
+        required: false
+        type: int
+    timings:
         description:
-            - Control to demo if the result of this module is changed or not.
-            - Parameter description can be a list as well.
+            - Record wall and CPU time, bytes read, subprocesses and peak RSS of each phase in C(_timings).
+            - Analysed deployments are also measured one by one.
         required: false
         type: bool
+        default: false
 
 author:
     - Giuseppe D"Aquanno (@GiuDaquan)
@@ -73,31 +93,69 @@ wildfly_info:
 """
 
 import glob
+import hashlib
+import io
+import json
+import multiprocessing
 import os
 import re
-import shutil
-import subprocess
+import resource
 import xml.etree.ElementTree as ET
 import zipfile
-from asyncio.subprocess import PIPE
-from typing import Callable, Dict, List, Pattern, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple, Union
 from xml.etree.ElementTree import Element
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.sniffer_io import (MultiPattern, PhaseTimer, count_bytes_read, list_files, measure_call, read_lines,
+                                             read_text, search_file, walk_files)
 
 SERVICE_CONF_DIR = "/etc/systemd/system/"
 WILDFLY_CONF_PATH = "/usr/local/wildfly/standalone/configuration/standalone.xml"
 WILDFLY_CONTENT_PATH = "/usr/local/wildfly/standalone/data/content"
 LOCAL_DIR = "/usr/local"
-WORK_DIR = "/tmp/server_sniffer/"
+ARCHIVE_EXTENSIONS = (".war", ".jar")
+POOL_EXTENSIONS = (".xml", ".properties")
+SERVICE_CONF_PATTERNS = MultiPattern({
+    "environment": r"Environment=(.*)",
+    # Da risolvere la questione del trattino
+    "environment_file": r"EnvironmentFile=-(.*)",
+    "user": r"User=(.*)",
+    "limit_nofile": r"LimitNOFILE=(.*)",
+    "pid_file": r"PIDFile=(.*)",
+    "exec_start": r"ExecStart=(.*)",
+    "stdout": r"StandardOutput=(.*)",
+})
+ENV_FILE_PATTERNS = MultiPattern({
+    "config": r"WILDFLY_CONFIG=(.*)",
+    "mode": r"WILDFLY_MODE=(.*)",
+    "bind": r"WILDFLY_BIND=(.*)",
+})
+# name: (prefilter, regex), files not containing any prefilter are not searched
+POOL_PATTERNS = {
+    "context_root": (b"context-root", r"<context-root>(.+)</context-root>"),
+    "datasources": (b"dsName=", r"dsName=(java:/?[A-Za-z0-9]+/[A-Za-z0-9]+/[A-Za-z0-9]+)"),
+}
+POOL_FILE_NAMES = ["jboss-deployment-structure.xml", "log4j.xml", "web.xml"]
 ORG_DIR = "/homes/36346daquanno/org"
+DEPLOYMENT_CACHE_PATH = "/var/tmp/server_sniffer/deployments.json"
+WORKER_NICENESS = 10
+DEPLOYMENT_ANALYSIS_KEYS = ["context_root", "datasources", "dependencies", "log_file", "roles"]
+FINGERPRINT_SECTIONS = {
+    "configuration": ["users", "datasources", "log_files"],
+    "deployments": ["deployments"],
+}
 
 
 def run_module() -> None:
     # define available arguments/parameters a user can pass to the module
     module_args = dict(
-    #    name=dict(type="str", requirefd=True),
-    #    new=dict(type="bool", required=False, default=False)
+        fingerprints=dict(type="dict", required=False, default={}),
+        cache_path=dict(type="str", required=False, default=DEPLOYMENT_CACHE_PATH),
+        known_deployments=dict(type="list", elements="str", required=False, default=[]),
+        max_workers=dict(type="int", required=False, default=0),
+        max_memory_mb=dict(type="int", required=False, default=0),
+        timings=dict(type="bool", required=False, default=False),
     )
 
     result = dict(changed=False, wildfly_info={})
@@ -107,18 +165,16 @@ def run_module() -> None:
     if module.check_mode:
         module.exit_json(**result)
 
-    total, used, free = shutil.disk_usage("/")
-    if used / total > 0.9:
-        module.fail_json(msg="Low storage space detected", **result)
-
     wildfly_info = result["wildfly_info"]
     wildfly_info["errors"] = []
+    timer = PhaseTimer(module.params["timings"])
 
     env_file_path = None
         
     # read wildfly service configuration file
     try:
-        wildfly_info["service_conf"] = get_service_conf_info()
+        with timer.phase("service_conf"):
+            wildfly_info["service_conf"] = get_service_conf_info()
         env_file_path = wildfly_info["service_conf"]["environment_file"]
     except Exception as e:
         wildfly_info["service_conf"] = None
@@ -126,14 +182,16 @@ def run_module() -> None:
 
     # read wildfly environment file
     try:
-        wildfly_info["env_file"] = get_environment_file_info(env_file_path)
+        with timer.phase("env_file"):
+            wildfly_info["env_file"] = get_environment_file_info(env_file_path)
     except Exception as e:
         wildfly_info["env_file"] = None
         wildfly_info["errors"].append(f"env_file: {str(e)}")
 
     # read org file
     try:
-        wildfly_info["org"] = get_org_info()
+        with timer.phase("org"):
+            wildfly_info["org"] = get_org_info()
     except Exception as e:
         wildfly_info["errors"].append(f"org: {str(e)}")
 
@@ -142,14 +200,63 @@ def run_module() -> None:
     subdirs = " ".join(os.listdir(LOCAL_DIR))
     wildfly_info["version"] = version_regex.search(subdirs).group(1)
 
-    # read wildfly configuration file
-    cat_cmd = f"cat {WILDFLY_CONF_PATH}"
-    cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
+    # sections whose fingerprint matches the previous one are not gathered again
+    with timer.phase("fingerprints"):
+        fingerprints = get_fingerprints()
+    previous_fingerprints = module.params["fingerprints"]
+    unchanged = [section for section, fp in fingerprints.items() if fp and previous_fingerprints.get(section) == fp]
+    wildfly_info["fingerprints"] = fingerprints
+    wildfly_info["unchanged"] = [key for section in unchanged for key in FINGERPRINT_SECTIONS[section]]
+
+    if len(unchanged) == len(FINGERPRINT_SECTIONS):
+        if timer.enabled:
+            wildfly_info["_timings"] = timer.get_timings()
+        module.exit_json(**result)
 
-    wildfly_info["users"] = get_users_info(cat_out)
-    wildfly_info["datasources"] = get_datasources_info(cat_out)
-    wildfly_info["log_files"] = get_logs_info(cat_out)
-    wildfly_info["deployments"] = get_deployments_info(cat_out, WILDFLY_CONTENT_PATH)
+    # read wildfly configuration file
+    with timer.phase("read_configuration"):
+        cat_out = read_text(WILDFLY_CONF_PATH)
+
+    # the configuration is parsed once and shared by all the extractors
+    with timer.phase("parse_configuration"):
+        wildfly_config = WildflyConfig(cat_out)
+
+    if "configuration" not in unchanged:
+        with timer.phase("users"):
+            wildfly_info["users"] = get_users_info(wildfly_config)
+        with timer.phase("datasources"):
+            wildfly_info["datasources"] = get_datasources_info(wildfly_config)
+        with timer.phase("log_files"):
+            wildfly_info["log_files"] = get_logs_info(wildfly_config)
+
+    if "deployments" not in unchanged:
+        cache_path = module.params["cache_path"]
+        known_deployments = set(module.params["known_deployments"])
+        with timer.phase("load_deployment_cache"):
+            deployment_cache = load_deployment_cache(cache_path)
+        max_workers = module.params["max_workers"] or get_default_workers()
+        max_memory_mb = module.params["max_memory_mb"]
+
+        deployment_errors = []
+        with timer.phase("deployments"):
+            wildfly_info["deployments"] = get_deployments_info(
+                wildfly_config, WILDFLY_CONTENT_PATH, deployment_cache, known_deployments, max_workers, max_memory_mb, timer,
+                deployment_errors
+            )
+
+        # failed analyses are retried by the next run, the section must not be skipped then
+        if deployment_errors:
+            wildfly_info["errors"].extend(deployment_errors)
+            wildfly_info["fingerprints"]["deployments"] = None
+
+        try:
+            with timer.phase("save_deployment_cache"):
+                save_deployment_cache(cache_path, deployment_cache)
+        except Exception as e:
+            wildfly_info["errors"].append(f"deployment_cache: {str(e)}")
+
+    if timer.enabled:
+        wildfly_info["_timings"] = timer.get_timings()
 
     module.exit_json(**result)
 
@@ -158,27 +265,51 @@ def main():
     run_module()
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Fingerprints
+# ----------------------------------------------------------------------------------------------------------------------
+def get_fingerprints() -> Dict:
+    ret = {}
+
+    try:
+        conf_fingerprint = get_file_fingerprint(WILDFLY_CONF_PATH)
+    except Exception:
+        return {section: None for section in FINGERPRINT_SECTIONS}
+
+    ret["configuration"] = conf_fingerprint
+
+    # deployments are content addressed, their sha1 list changes whenever a deployment does
+    try:
+        digest = hashlib.sha1(conf_fingerprint.encode("utf-8"))
+        for deployment_hash, _ in list_deployment_contents(WILDFLY_CONTENT_PATH):
+            digest.update(f"{deployment_hash}\n".encode("utf-8"))
+        ret["deployments"] = digest.hexdigest()
+    except Exception:
+        ret["deployments"] = None
+
+    return ret
+
+
+def get_file_fingerprint(file_path: str) -> str:
+    stat = os.stat(file_path)
+    return hashlib.sha1(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+#/----------------------------------------------------------------------------------------------------------------------
+# Fingerprints
+#/----------------------------------------------------------------------------------------------------------------------
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Wildfly configuration files dicovery
 # ----------------------------------------------------------------------------------------------------------------------
 def get_service_conf_info() -> Dict:
-    if len(glob.glob(SERVICE_CONF_DIR + "wildfly*.service")) != 1:
+    service_conf_files = glob.glob(SERVICE_CONF_DIR + "wildfly*.service")
+
+    if len(service_conf_files) != 1:
         raise Exception(f"No configuration file at {SERVICE_CONF_DIR}")
 
-    ret = {}
-    cat_cmd = f"cat {SERVICE_CONF_DIR}" + "wildfly*.service"    
-    cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
-    
-    try:
-        ret["environment"] = re.search(r"Environment=(.*)", cat_out).group(1)
-        # Da risolvere la questione del trattino
-        ret["environment_file"] = re.search(r"EnvironmentFile=-(.*)", cat_out).group(1)
-        ret["user"] = re.search(r"User=(.*)", cat_out).group(1)
-        ret["limit_nofile"] = re.search(r"LimitNOFILE=(.*)", cat_out).group(1)
-        ret["pid_file"] = re.search(r"PIDFile=(.*)", cat_out).group(1)
-        ret["exec_start"] = re.search(r"ExecStart=(.*)", cat_out).group(1)
-        ret["stdout"] = re.search(r"StandardOutput=(.*)", cat_out).group(1)
-    except:
+    ret = search_file(service_conf_files[0], SERVICE_CONF_PATTERNS)
+
+    if len(ret) != len(SERVICE_CONF_PATTERNS.patterns):
         raise Exception(f"Failed to read service configuration file at {SERVICE_CONF_DIR}")
 
     return ret
@@ -188,16 +319,10 @@ def get_environment_file_info(env_file_path: str) -> Dict:
     if not os.path.isfile(env_file_path):
         raise Exception(f"No environment configuration file at {env_file_path}")
 
-    ret = {}
-    cat_cmd = f"cat {env_file_path}"
-    cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
-    
-    try:
-        ret["config"] = re.search(r"WILDFLY_CONFIG=(.*)", cat_out).group(1)
-        ret["mode"] = re.search(r"WILDFLY_MODE=(.*)", cat_out).group(1)
-        ret["bind"] = re.search(r"WILDFLY_BIND=(.*)", cat_out).group(1)
-    except:
-        raise Exception(f"Failed to read environment configuration file at{env_file_path}")
+    ret = search_file(env_file_path, ENV_FILE_PATTERNS)
+
+    if len(ret) != len(ENV_FILE_PATTERNS.patterns):
+        raise Exception(f"Failed to read environment configuration file at {env_file_path}")
 
     return ret
 #/----------------------------------------------------------------------------------------------------------------------
@@ -208,14 +333,13 @@ def get_environment_file_info(env_file_path: str) -> Dict:
 #/----------------------------------------------------------------------------------------------------------------------
 # Wildfly configuration file data extraction
 #/----------------------------------------------------------------------------------------------------------------------
-def get_users_info(wildfly_conf_file: str) -> Dict:
+def get_users_info(wildfly_config: "WildflyConfig") -> Dict:
     ret = []
 
-    root = ET.fromstring(wildfly_conf_file)
-    ns_list = find_ns(root)
-    root_ns = ns_list[0]
-    xpath = f"./{root_ns}management/{root_ns}access-control/{root_ns}role-mapping/{root_ns}role"
-    roles = root.findall(xpath)
+    root_ns = wildfly_config.root_ns
+    xpath = f"./{root_ns}access-control/{root_ns}role-mapping/{root_ns}role"
+    management = wildfly_config.elements.get("management")
+    roles = management.findall(xpath) if management is not None else []
 
     for role in roles:
         entry = {}
@@ -235,15 +359,12 @@ def get_users_info(wildfly_conf_file: str) -> Dict:
     return ret
 
 
-def get_datasources_info(wildfly_conf_file: str) -> Dict:
+def get_datasources_info(wildfly_config: "WildflyConfig") -> Dict:
     ret = []
-    
-    root = ET.fromstring(wildfly_conf_file)
-    ns_list = find_ns(root, ["profile", "subsystem"], ["", "datasources"])
-    root_ns = ns_list[0]
-    ds_ns = ns_list[1]
-    xpath = f"./{root_ns}profile/{ds_ns}subsystem/{ds_ns}datasources/{ds_ns}datasource"
-    datasources = root.findall(xpath)
+
+    ds_ns, subsystem = wildfly_config.find_subsystem("datasources")
+    xpath = f"./{ds_ns}datasources/{ds_ns}datasource"
+    datasources = subsystem.findall(xpath)
 
     for datasource in datasources:
         entry = {}
@@ -261,15 +382,11 @@ def get_datasources_info(wildfly_conf_file: str) -> Dict:
     return ret
 
 
-def get_logs_info(wildfly_conf_file: str) -> Dict:
+def get_logs_info(wildfly_config: "WildflyConfig") -> Dict:
     ret = []
 
-    root = ET.fromstring(wildfly_conf_file)
-    ns_list = find_ns(root, ["profile", "subsystem"], ["", "logging"])
-    root_ns = ns_list[0]
-    log_ns = ns_list[1]
-    xpath = f"./{root_ns}profile/{log_ns}subsystem"
-    handlers = root.find(xpath).findall("./")
+    log_ns, subsystem = wildfly_config.find_subsystem("logging")
+    handlers = subsystem.findall("./")
     
     for handler in handlers:
         file = handler.find(f"{log_ns}file")
@@ -287,15 +404,17 @@ def get_logs_info(wildfly_conf_file: str) -> Dict:
     return ret
 
 
-def get_deployments_info(wildfly_conf_file: str, wildfly_content_path: str) -> Dict:
+def get_deployments_info(wildfly_config: "WildflyConfig", wildfly_content_path: str, deployment_cache: Dict[str, Dict]=None,
+                         known_deployments: set=frozenset(), max_workers: int=1, max_memory_mb: int=0,
+                         timer: PhaseTimer=None, errors: List[str]=None) -> Dict:
     ret = []
     hashes = {}
+    deployment_cache = {} if deployment_cache is None else deployment_cache
+    errors = [] if errors is None else errors
 
-    root = ET.fromstring(wildfly_conf_file)
-    ns_list = find_ns(root)
-    root_ns = ns_list[0]
-    xpath = f"./{root_ns}deployments/{root_ns}deployment"
-    deployments = root.findall(xpath)
+    root_ns = wildfly_config.root_ns
+    xpath = f"./{root_ns}deployment"
+    deployments = wildfly_config.elements["deployments"].findall(xpath) if "deployments" in wildfly_config.elements else []
 
     for deployment in deployments:
         deployment_hash = deployment.find(f"{root_ns}content").get("sha1")
@@ -304,18 +423,39 @@ def get_deployments_info(wildfly_conf_file: str, wildfly_content_path: str) -> D
         hashes[deployment_hash]["deployment_name"] = deployment.get("name")
         hashes[deployment_hash]["runtime_name"] = deployment.get("runtime-name")
 
-    for hash_prefix in os.listdir(wildfly_content_path):
-        for hash_remainder in os.listdir(os.path.join(wildfly_content_path, hash_prefix)):
-            dep_file_name = os.listdir(os.path.join(wildfly_content_path, hash_prefix, hash_remainder))[0]
-            dep_file_path = os.path.join(wildfly_content_path, hash_prefix, hash_remainder, dep_file_name)
+    # deployments are content addressed, an archive with a known sha1 is never analysed again
+    deployment_contents = list_deployment_contents(wildfly_content_path)
+    pending = {
+        assembled_hash: dep_file_path for assembled_hash, dep_file_path in deployment_contents
+        if assembled_hash not in known_deployments and assembled_hash not in deployment_cache
+    }
+    analyses, failures = analyse_deployments(pending, max_workers, max_memory_mb, timer)
+    deployment_cache.update(analyses)
 
-            assembled_hash = hash_prefix + hash_remainder
-            deployment_name = hashes[assembled_hash]["deployment_name"]
-            runtime_name = hashes[assembled_hash]["runtime_name"]
-            deployment_entry = extract_deployment_data(dep_file_path, deployment_name, runtime_name, assembled_hash)
+    # a failed analysis is reported and retried on the next run, it is never cached
+    for assembled_hash, error in failures.items():
+        errors.append(f"deployment {assembled_hash}: {error}")
+
+    for assembled_hash, _ in deployment_contents:
+        if assembled_hash in known_deployments:
+            deployment_entry = {"cached": True}
+        elif assembled_hash in failures:
+            deployment_entry = {key: None for key in DEPLOYMENT_ANALYSIS_KEYS}
+        else:
+            deployment_entry = dict(deployment_cache[assembled_hash])
+
+        deployment_entry["deploment_name"] = hashes[assembled_hash]["deployment_name"]
+        deployment_entry["runtime_name"] = hashes[assembled_hash]["runtime_name"]
+        deployment_entry["sha1"] = assembled_hash
+
+        ret.append(deployment_entry)
+
+    # entries of deployments no longer on the host are dropped
+    deployed_hashes = {deployment["sha1"] for deployment in ret}
+    for cached_hash in list(deployment_cache.keys()):
+        if cached_hash not in deployed_hashes:
+            del deployment_cache[cached_hash]
 
-            ret.append(deployment_entry)
-    
     return ret
 #/----------------------------------------------------------------------------------------------------------------------
 # Wildfly configuration file data extraction
@@ -325,36 +465,119 @@ def get_deployments_info(wildfly_conf_file: str, wildfly_content_path: str) -> D
 # ----------------------------------------------------------------------------------------------------------------------
 # Wildlfy deployment data extraction
 # ----------------------------------------------------------------------------------------------------------------------
-def extract_deployment_data(ear_file_path: str, deploment_name:str, runtime_name: str, deployment_hash: str) -> Dict:
+def extract_deployment_data(ear_file_path: str, timer: PhaseTimer=None) -> Dict:
     ret = {}
+    timer = PhaseTimer() if timer is None else timer
 
-    if os.path.exists(WORK_DIR):
-        shutil.rmtree(WORK_DIR)
-    os.makedirs(WORK_DIR)
+    pool_scanner = PoolScanner(POOL_PATTERNS, POOL_FILE_NAMES)
+    count_bytes_read(os.path.getsize(ear_file_path))
 
-    with zipfile.ZipFile(ear_file_path) as archive_file:
-        archive_file.extractall(WORK_DIR)
-    
-    archives_extensions = ["war", "jar"]
-    extract_archives(archives_extensions)
+    # nested archives are inspected in memory, nothing is extracted to disk and every member is read once
+    # the archive phase includes the pool scan, which is also reported on its own
+    with timer.phase("archive"), zipfile.ZipFile(ear_file_path) as archive_file:
+        for file_path, content in walk_archive(archive_file, ARCHIVE_EXTENSIONS, POOL_EXTENSIONS):
+            with timer.phase("pool_scan"):
+                pool_scanner.scan(file_path, content)
+
+    ret.update(pool_scanner.get_matches())
 
-    pool_extensions = ["xml", "properties"]
-    file_pool = generate_file_pool(pool_extensions)
+    with timer.phase("xml_parse"):
+        ret["dependencies"] = read_archive_file(pool_scanner.files, "jboss-deployment-structure.xml", get_deployment_structure_info)
+        ret["log_file"] = read_archive_file(pool_scanner.files, "log4j.xml", get_deployemnt_log_file_info)
+        ret["roles"] = read_archive_file(pool_scanner.files, "web.xml", get_deployment_roles_info)
 
-    ctx_root_regex = re.compile(r"<context-root>(.+)</context-root>")
-    datasource_regex = re.compile(r"dsName=(java:/?[A-Za-z0-9]+/[A-Za-z0-9]+/[A-Za-z0-9]+)")
-    ret["context_root"] = search_pool(file_pool, ctx_root_regex)
-    ret["datasources"] = search_pool(file_pool, datasource_regex)
+    return ret
 
-    ret["dependencies"] = read_archive_file("jboss-deployment-structure.xml", get_deployment_structure_info)
-    ret["log_file"] = read_archive_file("log4j.xml", get_deployemnt_log_file_info)
-    ret["roles"] = read_archive_file("web.xml", get_deployment_roles_info)
 
-    ret["deploment_name"] = deploment_name
-    ret["runtime_name"] = runtime_name
-    ret["sha1"] = deployment_hash
+def analyse_deployments(pending: Dict[str, str], max_workers: int, max_memory_mb: int,
+                        timer: PhaseTimer=None) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    # each analysis is measured where it runs when timings are requested
+    if timer is not None and timer.enabled:
+        measured, failures = run_analyses(measure_deployment_data, pending, max_workers, max_memory_mb)
+        for deployment_hash, (_, deployment_timings) in measured.items():
+            timer.add(deployment_hash, deployment_timings, group="deployments")
+        return {deployment_hash: data for deployment_hash, (data, _) in measured.items()}, failures
+
+    return run_analyses(extract_deployment_data, pending, max_workers, max_memory_mb)
 
-    return ret
+
+def measure_deployment_data(ear_file_path: str) -> Tuple[Dict, Dict]:
+    return measure_call(extract_deployment_data, ear_file_path)
+
+
+def run_analyses(analyse: Callable[[str], object], pending: Dict[str, str], max_workers: int,
+                 max_memory_mb: int) -> Tuple[Dict[str, object], Dict[str, str]]:
+    # archives are independent, they are analysed by a bounded pool of low priority worker processes
+    # an archive that is corrupted or goes over the memory limit fails its own analysis only
+    ret = {}
+    failures = {}
+
+    if max_workers <= 1 or len(pending) <= 1:
+        for deployment_hash, path in pending.items():
+            try:
+                ret[deployment_hash] = analyse(path)
+            except Exception as e:
+                failures[deployment_hash] = f"{type(e).__name__}: {str(e)}"
+        return ret, failures
+
+    mp_context = multiprocessing.get_context("fork")
+    workers = min(max_workers, len(pending))
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=limit_worker_resources,
+                             initargs=(max_memory_mb, WORKER_NICENESS)) as executor:
+        futures = {deployment_hash: executor.submit(analyse, path) for deployment_hash, path in pending.items()}
+        for deployment_hash, future in futures.items():
+            try:
+                ret[deployment_hash] = future.result()
+            except Exception as e:
+                failures[deployment_hash] = f"{type(e).__name__}: {str(e)}"
+
+    return ret, failures
+
+
+def limit_worker_resources(max_memory_mb: int, niceness: int) -> None:
+    os.nice(niceness)
+
+    if max_memory_mb > 0:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def get_default_workers() -> int:
+    # half of the CPUs the module may run on, the rest is left to the application server
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return max(1, cpus // 2)
+
+
+def list_deployment_contents(wildfly_content_path: str) -> List[Tuple[str, str]]:
+    # contents are stored as <content path>/<first two sha1 chars>/<remaining sha1 chars>/content
+    ret = []
+
+    for dep_file_path in walk_files(wildfly_content_path):
+        hash_parts = os.path.relpath(os.path.dirname(dep_file_path), wildfly_content_path).split(os.sep)
+        if len(hash_parts) == 2:
+            ret.append(("".join(hash_parts), dep_file_path))
+
+    return sorted(ret)
+
+
+def load_deployment_cache(cache_path: str) -> Dict[str, Dict]:
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+    return {sha1: entry for sha1, entry in cache.items() if all(key in entry for key in DEPLOYMENT_ANALYSIS_KEYS)}
+
+
+def save_deployment_cache(cache_path: str, deployment_cache: Dict[str, Dict]) -> None:
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as cache_file:
+        json.dump(deployment_cache, cache_file)
+    os.replace(tmp_path, cache_path)
 
 
 def get_deployment_structure_info(raw_file: str) -> Dict:
@@ -421,16 +644,14 @@ def get_deployment_roles_info(raw_file: str) -> List[str]:
 # ----------------------------------------------------------------------------------------------------------------------
 def get_org_info() -> Dict:
     ret = {}
-    files = os.listdir(ORG_DIR)
-    
+    files = list_files(ORG_DIR)
+
     if not files:
         raise Exception(f"Failed to read org file at {ORG_DIR}")
 
-    for file in files:
+    for file, file_path in files:
         file_name = re.search(r"(.*)\.", file).group(1)
-        cat_cmd = f"cat {os.path.join(ORG_DIR, file)}"
-        cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace").split("\n")
-        ret[file_name] = [line for line in cat_out if line]
+        ret[file_name] = read_lines(file_path)
 
     return ret
 
@@ -442,68 +663,70 @@ def get_org_info() -> Dict:
 # ----------------------------------------------------------------------------------------------------------------------
 # XML Helpers
 # ----------------------------------------------------------------------------------------------------------------------
-def find_ns(xml_root: Element, tag_list: List[str]=[], ns_keywords: List[str]=[]) -> str:
-    ret_ns = []
-    ns_regex = re.compile(r"(\{.*\})(.*)")
-    match = ns_regex.search(xml_root.tag)
-    ret_ns.append(match.group(1))
-
-    while len(tag_list) > 0 and len(ns_keywords) > 0:
-        search_tag = tag_list.pop(0)
-        ns_keyword = ns_keywords.pop(0)
-        children = xml_root.findall("./")
-        
-        xml_root, found_ns = find_match(children, search_tag, ns_keyword, ns_regex)
-        ret_ns = ret_ns + [found_ns] if found_ns not in ret_ns else ret_ns
-
-    return ret_ns
+class WildflyConfig:
 
 
-def find_match(xml_elems: List[Element], search_tag: str, ns_keyword: str, regex: Pattern) -> Tuple[Element, str]:
-    for elem in xml_elems:
-        match = regex.search(elem.tag)
-        ns = match.group(1)
-        tag = match.group(2)
+    NS_REGEX = re.compile(r"(\{.*\})(.*)")
 
-        if ns_keyword in ns and tag == search_tag:
-            return elem, ns
-#/---------------------------------------------------------------------------------------------------------------------
-# XML Helpers
-#/----------------------------------------------------------------------------------------------------------------------
 
+    def __init__(self, wildfly_conf_file: str):
+        self.root = ET.fromstring(wildfly_conf_file)
+        self.root_ns = self.NS_REGEX.search(self.root.tag).group(1)
+        self.elements = {}
+        self.subsystems = []
+        self.__subsystem_index = {}
 
-# ----------------------------------------------------------------------------------------------------------------------
-# Archives Helpers
-# ----------------------------------------------------------------------------------------------------------------------
-def extract_archives(archive_extensions: List[str]) -> None:
-    for ext in archive_extensions:
-        find_cmd = f"find {WORK_DIR} -name *.{ext}"
-        archives = subprocess.run(find_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace").split("\n")
-        archives.remove("")
+        for elem in self.root:
+            self.elements.setdefault(self.NS_REGEX.search(elem.tag).group(2), elem)
 
-        for archive in archives:
-            sub_dir_name = os.path.join(WORK_DIR, archive.split("/")[-1].replace(f".{ext}", "")) + f"_{ext}"
-            
-            if not os.path.exists(sub_dir_name):
-                os.makedirs(sub_dir_name)
+        # subsystem namespaces are resolved in a single pass over the profile
+        profile = self.elements.get("profile")
+        for elem in (profile if profile is not None else []):
+            ns, tag = self.NS_REGEX.search(elem.tag).groups()
+            if tag == "subsystem":
+                self.subsystems.append((ns, elem))
 
-            with zipfile.ZipFile(archive) as archive_file:
-                archive_file.extractall(sub_dir_name)
 
-    return
+    def find_subsystem(self, ns_keyword: str) -> Tuple[str, Element]:
+        if ns_keyword not in self.__subsystem_index:
+            matches = [(ns, elem) for ns, elem in self.subsystems if ns_keyword in ns]
+            self.__subsystem_index[ns_keyword] = matches[0] if matches else None
 
+        if self.__subsystem_index[ns_keyword] is None:
+            raise Exception(f"No {ns_keyword} subsystem in {WILDFLY_CONF_PATH}")
 
-def read_archive_file(file_name: str, handler: Callable[[str], dict]) -> Union[Dict, None]:
-    find_cmd = f"find {WORK_DIR} -name {file_name}"
-    file_path = subprocess.run(find_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace").strip()
+        return self.__subsystem_index[ns_keyword]
+#/---------------------------------------------------------------------------------------------------------------------
+# XML Helpers
+#/----------------------------------------------------------------------------------------------------------------------
 
-    if not file_path:
-        return None
 
-    cat_cmd = f"cat {file_path}"
-    cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
-    
-    return handler(cat_out) if cat_out else None
+# ----------------------------------------------------------------------------------------------------------------------
+# Archives Helpers
+# ----------------------------------------------------------------------------------------------------------------------
+def walk_archive(archive_file: zipfile.ZipFile, archive_extensions: Tuple[str, ...], file_extensions: Tuple[str, ...],
+                 prefix: str="") -> Iterator[Tuple[str, bytes]]:
+    # nested archives are opened from memory, only members with the wanted extensions are read
+    for member in archive_file.infolist():
+        if member.is_dir():
+            continue
+
+        member_path = prefix + member.filename
+
+        if member.filename.endswith(archive_extensions):
+            nested_file = io.BytesIO(archive_file.read(member))
+            try:
+                with zipfile.ZipFile(nested_file) as nested_archive:
+                    yield from walk_archive(nested_archive, archive_extensions, file_extensions, member_path + "!/")
+            except zipfile.BadZipFile:
+                continue
+        elif member.filename.endswith(file_extensions):
+            yield member_path, archive_file.read(member)
+
+
+def read_archive_file(files: Dict[str, bytes], file_name: str, handler: Callable[[str], dict]) -> Union[Dict, None]:
+    content = files.get(file_name, b"").decode("utf-8", errors="replace")
+    return handler(content) if content else None
 #/----------------------------------------------------------------------------------------------------------------------
 # Archives Helpers
 #/----------------------------------------------------------------------------------------------------------------------
@@ -512,35 +735,42 @@ def read_archive_file(file_name: str, handler: Callable[[str], dict]) -> Union[D
 # ----------------------------------------------------------------------------------------------------------------------
 # File Pool Helpers
 # ----------------------------------------------------------------------------------------------------------------------
-def generate_file_pool(pool_extensions: List[str]) -> List[str]:
-    ret = []
+class PoolScanner:
 
-    for ext in pool_extensions:
-        find_cmd = f"find {WORK_DIR} -name *.{ext}"
-        files = subprocess.run(find_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace").split("\n")
-        files.remove("")
-        ret += files
 
-    return ret
+    def __init__(self, patterns: Dict[str, Tuple[bytes, str]], file_names: List[str]):
+        self.patterns = MultiPattern({name: regex for name, (_, regex) in patterns.items()})
+        self.prefilters = [prefilter for prefilter, _ in patterns.values()]
+        self.file_names = set(file_names)
+        self.matches = {name: set() for name in patterns}
+        self.files = {}
 
 
-def search_pool(file_pool: List[str], regex: Pattern) -> Union[List[str], str, None]:
-    ret = set()
+    def scan(self, file_path: str, content: bytes) -> None:
+        # the first file found for each wanted name is kept for the dedicated handlers
+        file_name = file_path.rsplit("/", 1)[-1]
+        if file_name in self.file_names and file_name not in self.files:
+            self.files[file_name] = content
 
-    for file in file_pool:
-        cat_cmd = f"cat {file}"
-        cat_out = subprocess.run(cat_cmd, stdout=PIPE, shell=True).stdout.decode("utf-8", errors="replace")
-        match = regex.search(cat_out)
-        ret = ret | {match.group(1)} if match else ret
+        if not any(prefilter in content for prefilter in self.prefilters):
+            return
 
-    if len(ret) > 1:
-        ret = list(ret)
-    elif len(ret) == 1:
-        ret = ret.pop()
-    else:
-        ret = None
+        for name, value in self.patterns.search(content).items():
+            self.matches[name].add(value)
 
-    return ret
+
+    def get_matches(self) -> Dict[str, Union[List[str], str, None]]:
+        ret = {}
+
+        for name, values in self.matches.items():
+            if len(values) > 1:
+                ret[name] = list(values)
+            elif len(values) == 1:
+                ret[name] = next(iter(values))
+            else:
+                ret[name] = None
+
+        return ret
 #/----------------------------------------------------------------------------------------------------------------------
 # File Pool Helpers
 #/----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Tuple, Union
+
+from ansible_gatherer import FACT_KEYS, FLEET_MAX_WORKERS, MODULE_RESULT_KEYS, AnsibleGatherer
+from ansible_module_utils.sniffer_io import PhaseTimer
+from deployment_cache import DeploymentCache
+from playbook_output import read_playbook_results_async
+
+# the asyncio child watcher reaps the processes it starts, the playbook is run by this launcher which waits for it
+# and writes its resource usage to the file given as first argument
+PLAYBOOK_LAUNCHER = """
+import json, resource, subprocess, sys
+returncode = subprocess.call(sys.argv[2:])
+with open(sys.argv[1], "w") as usage_file:
+    json.dump(list(resource.getrusage(resource.RUSAGE_CHILDREN)), usage_file)
+sys.exit(returncode if returncode >= 0 else 128 - returncode)
+"""
+
+
+class AsyncAnsibleGatherer(AnsibleGatherer):
+
+
+    def __init__(self, inventory_file_path: str, deployment_cache: DeploymentCache=None, timings: bool=False,
+                 module_timeout: int=None, host_timeout: int=None, deployment_workers: int=0, deployment_memory_mb: int=0,
+                 max_concurrency: int=FLEET_MAX_WORKERS):
+        super().__init__(inventory_file_path, deployment_cache, timings, module_timeout, host_timeout, deployment_workers,
+                         deployment_memory_mb)
+        # at most max_concurrency ansible-playbook runs at a time, shared by every caller of this gatherer
+        self.max_concurrency = max_concurrency
+        self.__semaphore = None
+
+
+    async def gather_server_info(self, server_name: str, previous_info: dict=None) -> dict:
+        previous_infos = {server_name: previous_info} if previous_info else None
+        server_info = (await self.gather_group_info([server_name], previous_infos))[server_name]
+
+        if isinstance(server_info, Exception):
+            raise server_info
+
+        return server_info
+
+
+    async def gather_group_info(self, server_names: List[str], previous_infos: Dict[str, dict]=None) -> Dict[str, Union[dict, Exception]]:
+        previous_infos = previous_infos or {}
+        self._seed_deployment_cache(previous_infos)
+
+        group_timer = PhaseTimer(self.timings, per_thread=True)
+        async with self.__get_semaphore():
+            start = time.perf_counter()
+            module_results, usage = await self.__exec_playbook(server_names, previous_infos)
+            group_timer.add_rusage("exec_playbook", time.perf_counter() - start, usage)
+
+        # packages expansion and section hashing are cpu bound, they are kept off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._build_group_info, server_names, module_results, previous_infos, group_timer)
+
+
+    async def gather_fleet(self, server_names: Iterable[str], previous_infos: Dict[str, dict]=None) -> AsyncIterator[Tuple[str, Union[dict, Exception]]]:
+        # results are yielded as soon as each host completes, closing the iterator cancels the pending hosts
+        previous_infos = previous_infos or {}
+        tasks = [
+            asyncio.ensure_future(self.__gather_host(server_name, previous_infos.get(server_name)))
+            for server_name in server_names
+        ]
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+    async def __gather_host(self, server_name: str, previous_info: dict) -> Tuple[str, Union[dict, Exception]]:
+        try:
+            return server_name, await self.gather_server_info(server_name, previous_info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return server_name, e
+
+
+    async def __exec_playbook(self, server_names: List[str], previous_infos: Dict[str, dict]) -> Tuple[Dict[str, Dict[str, dict]], resource.struct_rusage]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cmd, env = self._prepare_playbook_run(tmp_dir, server_names, previous_infos)
+            stderr_path = os.path.join(tmp_dir, "stderr.log")
+            usage_path = os.path.join(tmp_dir, "usage.json")
+
+            # stdout is read by the event loop and pushed to the decoder, no thread is held while the run goes on
+            with open(stderr_path, "wb") as stderr_file:
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-c", PLAYBOOK_LAUNCHER, usage_path, *cmd,
+                    stdout=asyncio.subprocess.PIPE, stderr=stderr_file, env=env, start_new_session=True
+                )
+
+            try:
+                module_results = await asyncio.wait_for(self.__wait_playbook_run(cmd, process, stderr_path), self.host_timeout)
+            except asyncio.TimeoutError:
+                await self.__kill(process)
+                raise Exception(f"Timed out after {self.host_timeout}s executing ansible command: {' '.join(cmd)}")
+            except BaseException:
+                await self.__kill(process)
+                raise
+
+            with open(usage_path) as usage_file:
+                usage = resource.struct_rusage(json.load(usage_file))
+
+        return module_results, usage
+
+
+    async def __wait_playbook_run(self, cmd: List[str], process: asyncio.subprocess.Process, stderr_path: str) -> Dict[str, Dict[str, dict]]:
+        # stderr is complete once the run has exited, the wait is bounded by the deadline of the run
+        try:
+            module_results = await read_playbook_results_async(process.stdout, MODULE_RESULT_KEYS, FACT_KEYS)
+        except Exception:
+            await process.wait()
+            raise self._get_playbook_error(cmd, stderr_path)
+
+        await process.wait()
+        return module_results
+
+
+    async def __kill(self, process: asyncio.subprocess.Process) -> None:
+        # the run has a session of its own, the launcher, the playbook and its ssh connections are killed with it
+        self._kill_playbook_run(process.pid)
+        await process.wait()
+
+
+    def __get_semaphore(self) -> asyncio.Semaphore:
+        # created on first use, inside the running event loop
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.__semaphore
@@ -0,0 +1,133 @@
+import datetime
+from typing import Dict, List
+
+from pymongo import ASCENDING
+
+from mongo_clients import (DEFAULT_CONNECT_TIMEOUT_MS, DEFAULT_MAX_POOL_SIZE, DEFAULT_MIN_POOL_SIZE,
+                           DEFAULT_SERVER_SELECTION_TIMEOUT_MS, get_async_client)
+from snapshot_queries import (CHANGES_COLLECTION, DAILY_LAYOUT, DATE_FORMAT, DATES_BY_HOST_PIPELINE, HISTORY_PROJECTION,
+                              HOSTS_BY_DATE_PIPELINE, LATEST_SNAPSHOTS_PIPELINE, SECTIONS_COLLECTION, SNAPSHOTS_COLLECTION,
+                              SNAPSHOTS_LAYOUT, decode_document, get_changes_projection, get_daily_collection_names,
+                              get_host_dates_query, get_listing_collection, get_section_refs, get_snapshot_projection,
+                              get_snapshot_query, is_in_date_range, nest_changes, read_dates_by_host, read_hosts_by_date,
+                              read_latest_snapshots)
+
+
+class AsyncMongoHelper:
+
+
+    def __init__(self, db_name: str, host:str, port: str, username: str="", password: str="",
+                 layout: str=DAILY_LAYOUT, max_pool_size: int=DEFAULT_MAX_POOL_SIZE,
+                 min_pool_size: int=DEFAULT_MIN_POOL_SIZE, connect_timeout_ms: int=DEFAULT_CONNECT_TIMEOUT_MS,
+                 server_selection_timeout_ms: int=DEFAULT_SERVER_SELECTION_TIMEOUT_MS, socket_timeout_ms: int=None):
+        if layout not in (DAILY_LAYOUT, SNAPSHOTS_LAYOUT):
+            raise Exception(f"Unknown storage layout: {layout}")
+
+        # read paths of MongoHelper for the async web tier, writes stay on the sync helper
+        # queries and decoding are shared with it through snapshot_queries, only the round trips are awaited here
+        self.client = get_async_client(host, port, username, password, max_pool_size, min_pool_size, connect_timeout_ms,
+                                       server_selection_timeout_ms, socket_timeout_ms)
+        self.db_handle = self.client.get_database(db_name)
+        self.DATE_FORMAT = DATE_FORMAT
+        self.layout = layout
+
+
+    def get_collection_name(self, date: datetime.datetime) -> str:
+        return date.strftime(self.DATE_FORMAT)
+
+
+    def get_collection_date(self, date: str) -> datetime.date:
+        return datetime.datetime.strptime(date, self.DATE_FORMAT).date()
+
+
+    async def get_collection_names(self) -> List[str]:
+        if self.layout == SNAPSHOTS_LAYOUT:
+            return sorted(await self.db_handle[SNAPSHOTS_COLLECTION].distinct("snapshot_date"))
+
+        return get_daily_collection_names(await self.db_handle.list_collection_names())
+
+
+    async def get_documents(self, collection_name: str) -> List[str]:
+        try:
+            collection, query = get_snapshot_query(self.db_handle, self.layout, collection_name)
+            documents = await collection.find(query, {"system_info.hostname": 1}).to_list(length=None)
+            return [document["system_info"]["hostname"].upper() for document in documents]
+        except:
+            return []
+
+
+    async def find_document(self, collection_name: str, server_name: str, sections: List[str]=None) -> dict:
+        try:
+            collection, query = get_snapshot_query(self.db_handle, self.layout, collection_name, server_name)
+            doc = await collection.find_one(query, projection=get_snapshot_projection(self.layout, sections))
+            await self.__decode_document(doc)
+            return doc
+        except:
+            return None
+
+
+    async def get_hosts_by_date(self) -> Dict[str, List[str]]:
+        cursor = get_listing_collection(self.db_handle, self.layout).aggregate(HOSTS_BY_DATE_PIPELINE)
+        return read_hosts_by_date(await cursor.to_list(length=None))
+
+
+    async def get_dates_by_host(self) -> Dict[str, List[str]]:
+        cursor = get_listing_collection(self.db_handle, self.layout).aggregate(DATES_BY_HOST_PIPELINE)
+        return read_dates_by_host(await cursor.to_list(length=None))
+
+
+    async def get_server_dates(self, server_name: str) -> List[str]:
+        listing_collection = get_listing_collection(self.db_handle, self.layout)
+        cursor = listing_collection.find(get_host_dates_query(server_name), {"_id": False, "snapshot_date": True})
+        return [doc["snapshot_date"] async for doc in cursor.sort("snapshot_date", ASCENDING)]
+
+
+    async def get_latest_snapshots(self) -> Dict[str, str]:
+        cursor = get_listing_collection(self.db_handle, self.layout).aggregate(LATEST_SNAPSHOTS_PIPELINE)
+        return read_latest_snapshots(await cursor.to_list(length=None))
+
+
+    async def get_server_history(self, server_name: str, start_date: str=None, end_date: str=None) -> List[dict]:
+        ret = []
+
+        if self.layout == SNAPSHOTS_LAYOUT:
+            query = get_host_dates_query(server_name, start_date, end_date)
+            async for doc in self.db_handle[SNAPSHOTS_COLLECTION].find(query, HISTORY_PROJECTION).sort("snapshot_date", ASCENDING):
+                await self.__decode_document(doc)
+                ret.append(doc)
+
+            return ret
+
+        for collection_name in await self.get_collection_names():
+            if not is_in_date_range(collection_name, start_date, end_date):
+                continue
+
+            doc = await self.find_document(collection_name, server_name)
+            if doc is not None:
+                doc["snapshot_date"] = collection_name
+                ret.append(doc)
+
+        return ret
+
+
+    async def get_changes(self, server_name: str, start_date: str=None, end_date: str=None) -> List[dict]:
+        query = get_host_dates_query(server_name, start_date, end_date)
+        cursor = self.db_handle[CHANGES_COLLECTION].find(query, {"_id": False}).sort("snapshot_date", ASCENDING)
+        return [nest_changes(record) async for record in cursor]
+
+
+    async def get_changes_by_date(self, collection_name: str, details: bool=False) -> List[dict]:
+        projection = get_changes_projection(details)
+        cursor = self.db_handle[CHANGES_COLLECTION].find({"snapshot_date": collection_name}, projection).sort("hostname", ASCENDING)
+        return [nest_changes(record) async for record in cursor]
+
+
+    async def __decode_document(self, server_info: dict) -> None:
+        section_hashes = get_section_refs(server_info)
+        section_values = {}
+
+        if section_hashes:
+            cursor = self.db_handle[SECTIONS_COLLECTION].find({"_id": {"$in": section_hashes}})
+            section_values = {section["_id"]: section["value"] async for section in cursor}
+
+        decode_document(server_info, section_values)
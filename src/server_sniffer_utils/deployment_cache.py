@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+from typing import Dict, List, Union
+
+DEPLOYMENT_ANALYSIS_KEYS = ["context_root", "datasources", "dependencies", "log_file", "roles"]
+
+
+class DeploymentCache:
+
+
+    def __init__(self, cache_file_path: str=None):
+        self.cache_file_path = cache_file_path
+        self.__lock = threading.Lock()
+        self.__entries = {}
+
+        if cache_file_path and os.path.isfile(cache_file_path):
+            with open(cache_file_path) as cache_file:
+                self.__entries = json.load(cache_file)
+
+
+    def get_known_sha1s(self) -> List[str]:
+        with self.__lock:
+            return sorted(self.__entries.keys())
+
+
+    def get(self, sha1: str) -> Union[Dict, None]:
+        with self.__lock:
+            entry = self.__entries.get(sha1)
+            return dict(entry) if entry is not None else None
+
+
+    def update(self, deployments: List[dict]) -> None:
+        # only complete analyses are cached, entries resolved from the cache itself are skipped
+        # failed analyses come back with every key None, they are left out so that they are retried
+        with self.__lock:
+            for deployment in deployments:
+                if deployment.get("cached") or not all(key in deployment for key in DEPLOYMENT_ANALYSIS_KEYS):
+                    continue
+                if all(deployment[key] is None for key in DEPLOYMENT_ANALYSIS_KEYS):
+                    continue
+                self.__entries[deployment["sha1"]] = {key: deployment[key] for key in DEPLOYMENT_ANALYSIS_KEYS}
+
+
+    def save(self) -> None:
+        if not self.cache_file_path:
+            return
+
+        with self.__lock:
+            tmp_path = self.cache_file_path + ".tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump(self.__entries, cache_file)
+            os.replace(tmp_path, self.cache_file_path)
@@ -0,0 +1,55 @@
+import os
+import threading
+from typing import Dict, List, Set
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as InventoryLoader
+except ImportError:
+    from yaml import SafeLoader as InventoryLoader
+
+
+class Inventory:
+
+
+    def __init__(self, inventory_file_path: str):
+        self.inventory_file_path = inventory_file_path
+        self.__lock = threading.Lock()
+        self.__file_signature = None
+        self.__host_groups = {}
+
+
+    def get_server_names(self) -> List[str]:
+        return sorted(self.__get_host_groups().keys())
+
+
+    def get_groups(self, server_name: str) -> Set[str]:
+        return self.__get_host_groups().get(server_name, set())
+
+
+    def __get_host_groups(self) -> Dict[str, Set[str]]:
+        # the inventory file is parsed again only when its mtime or size change
+        stat = os.stat(self.inventory_file_path)
+        file_signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self.__lock:
+            if file_signature != self.__file_signature:
+                self.__host_groups = self.__load_host_groups()
+                self.__file_signature = file_signature
+
+            return self.__host_groups
+
+
+    def __load_host_groups(self) -> Dict[str, Set[str]]:
+        ret = {}
+
+        with open(self.inventory_file_path) as inventory_file:
+            inventory = yaml.load(inventory_file, Loader=InventoryLoader)
+
+        for group_name, group in inventory["all"]["children"].items():
+            hosts = (group or {}).get("hosts") or {}
+            for host in hosts.keys():
+                ret.setdefault(host, set()).add(group_name)
+
+        return ret
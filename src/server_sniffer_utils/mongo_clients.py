@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from pymongo import MongoClient
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_CONNECT_TIMEOUT_MS = 20000
+DEFAULT_SERVER_SELECTION_TIMEOUT_MS = 30000
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str, port: str, username: str="", password: str="", max_pool_size: int=DEFAULT_MAX_POOL_SIZE,
+               min_pool_size: int=DEFAULT_MIN_POOL_SIZE, connect_timeout_ms: int=DEFAULT_CONNECT_TIMEOUT_MS,
+               server_selection_timeout_ms: int=DEFAULT_SERVER_SELECTION_TIMEOUT_MS,
+               socket_timeout_ms: int=None) -> MongoClient:
+    # one client, and so one connection pool, per process and set of connection parameters
+    options = get_client_options(max_pool_size, min_pool_size, connect_timeout_ms, server_selection_timeout_ms,
+                                 socket_timeout_ms)
+    key = ("sync", host, int(port), username, password, tuple(sorted(options.items())))
+
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = MongoClient(host=host, port=int(port), username=username, password=password, **options)
+        return _clients[key]
+
+
+def get_async_client(host: str, port: str, username: str="", password: str="", max_pool_size: int=DEFAULT_MAX_POOL_SIZE,
+                     min_pool_size: int=DEFAULT_MIN_POOL_SIZE, connect_timeout_ms: int=DEFAULT_CONNECT_TIMEOUT_MS,
+                     server_selection_timeout_ms: int=DEFAULT_SERVER_SELECTION_TIMEOUT_MS,
+                     socket_timeout_ms: int=None) -> "AsyncIOMotorClient":
+    if AsyncIOMotorClient is None:
+        raise Exception("The async helper requires motor: pip install server_sniffer_utils[async]")
+
+    # motor clients are bound to the event loop they were first used on
+    try:
+        loop_id = id(asyncio.get_running_loop())
+    except RuntimeError:
+        loop_id = None
+
+    options = get_client_options(max_pool_size, min_pool_size, connect_timeout_ms, server_selection_timeout_ms,
+                                 socket_timeout_ms)
+    key = ("async", host, int(port), username, password, tuple(sorted(options.items())), loop_id)
+
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = AsyncIOMotorClient(host=host, port=int(port), username=username, password=password, **options)
+        return _clients[key]
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def get_client_options(max_pool_size: int, min_pool_size: int, connect_timeout_ms: int, server_selection_timeout_ms: int,
+                       socket_timeout_ms: int) -> dict:
+    ret = {}
+    ret["maxPoolSize"] = max_pool_size
+    ret["minPoolSize"] = min_pool_size
+    ret["connectTimeoutMS"] = connect_timeout_ms
+    ret["serverSelectionTimeoutMS"] = server_selection_timeout_ms
+    ret["socketTimeoutMS"] = socket_timeout_ms
+    return ret
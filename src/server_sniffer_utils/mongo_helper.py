@@ -1,22 +1,54 @@
 import datetime
-from typing import List
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
+import bson
 from deepdiff import DeepDiff
-from pymongo import MongoClient
+from pymongo import ASCENDING, InsertOne, ReplaceOne, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from mongo_clients import (DEFAULT_CONNECT_TIMEOUT_MS, DEFAULT_MAX_POOL_SIZE, DEFAULT_MIN_POOL_SIZE,
+                           DEFAULT_SERVER_SELECTION_TIMEOUT_MS, get_client)
+from packages import encode_packages
+from snapshot_diff import diff_snapshot_entries, diff_snapshots
+from snapshot_queries import (CHANGES_COLLECTION, DAILY_LAYOUT, DATE_FORMAT, DATES_BY_HOST_PIPELINE, HISTORY_PROJECTION,
+                              HOSTS_BY_DATE_PIPELINE, LATEST_SNAPSHOTS_PIPELINE, LAZY_SECTIONS, SECTION_REF_KEY,
+                              SECTIONS_COLLECTION, SNAPSHOT_INDEX_COLLECTION, SNAPSHOTS_COLLECTION, SNAPSHOTS_LAYOUT,
+                              decode_document, get_changes_projection, get_daily_collection_names, get_host_dates_query,
+                              get_listing_collection, get_previous_dates_pipeline, get_section_refs, get_snapshot_projection,
+                              get_snapshot_query, is_in_date_range, nest_changes, read_dates_by_host, read_hosts_by_date,
+                              read_latest_snapshots)
+from snapshot_sections import SECTION_HASHES_KEY, compute_section_hashes, iter_sections
+
+WRITE_BATCH_SIZE = 50
+# the server limit, documents over it are rejected by the driver before the batch is sent
+MAX_DOCUMENT_SIZE = 16 * 1024 * 1024
 
 
 class MongoHelper:
 
 
-    def __init__(self, db_name: str, host:str, port: str, username: str="", password: str=""):
-        self.client = MongoClient(host=host, port=int(port), username=username, password=password)
+    def __init__(self, db_name: str, host:str, port: str, username: str="", password: str="", compact_packages: bool=False,
+                 layout: str=DAILY_LAYOUT, track_changes: bool=False, dedupe_sections: bool=False,
+                 max_pool_size: int=DEFAULT_MAX_POOL_SIZE, min_pool_size: int=DEFAULT_MIN_POOL_SIZE,
+                 connect_timeout_ms: int=DEFAULT_CONNECT_TIMEOUT_MS,
+                 server_selection_timeout_ms: int=DEFAULT_SERVER_SELECTION_TIMEOUT_MS, socket_timeout_ms: int=None):
+        if layout not in (DAILY_LAYOUT, SNAPSHOTS_LAYOUT):
+            raise Exception(f"Unknown storage layout: {layout}")
+
+        # the client is shared by every helper with the same connection parameters
+        self.client = get_client(host, port, username, password, max_pool_size, min_pool_size, connect_timeout_ms,
+                                 server_selection_timeout_ms, socket_timeout_ms)
         self.db_handle = self.client.get_database(db_name)
-        self.DATE_FORMAT = "%Y-%m-%d"
-        try:
-            self.db_handle.create_collection(db_name)
-        except Exception:
-            pass
-        
+        self.DATE_FORMAT = DATE_FORMAT
+        self.compact_packages = compact_packages
+        self.layout = layout
+        self.track_changes = track_changes
+        self.dedupe_sections = dedupe_sections
+        self.__indexed_collections = set()
+        self.__stored_sections = set()
+
 
     def get_collection_name(self, date: datetime.datetime) -> str:
         return date.strftime(self.DATE_FORMAT)
@@ -27,41 +59,166 @@ class MongoHelper:
 
     
     def get_collection_names(self) -> List[str]:
-        return self.db_handle.list_collection_names()
+        # with the snapshots layout every snapshot date plays the role of a daily collection
+        if self.layout == SNAPSHOTS_LAYOUT:
+            return sorted(self.db_handle[SNAPSHOTS_COLLECTION].distinct("snapshot_date"))
+
+        return get_daily_collection_names(self.db_handle.list_collection_names())
 
 
     def get_documents(self, collection_name: str) -> list[dict]:
         try:
-            collection = self.db_handle[collection_name]
-            documents = list(collection.find({}, {"system_info.hostname": 1}))
+            collection, query = get_snapshot_query(self.db_handle, self.layout, collection_name)
+            documents = list(collection.find(query, {"system_info.hostname": 1}))
             return [document["system_info"]["hostname"].upper() for document in documents]
         except:
             return []
 
 
-    def find_document(self, collection_name: str, server_name: str) -> dict:
+    def find_document(self, collection_name: str, server_name: str, sections: List[str]=None) -> dict:
         try:
-            collection = self.db_handle[collection_name]
-            doc = collection.find_one({'system_info.hostname': server_name.lower()}, projection={'_id': False})
-            self.__apply_projection(doc)
+            collection, query = get_snapshot_query(self.db_handle, self.layout, collection_name, server_name)
+            doc = collection.find_one(query, projection=get_snapshot_projection(self.layout, sections))
+            self.__decode_document(doc)
             return doc
         except:
             return None
-        
+
+
+    def find_lazy_document(self, collection_name: str, server_name: str) -> "LazyDocument":
+        return LazyDocument(self, collection_name, server_name)
+
+
+    def has_section(self, collection_name: str, server_name: str, section: str) -> bool:
+        collection, query = get_snapshot_query(self.db_handle, self.layout, collection_name, server_name)
+        query[section] = {"$exists": True}
+        return collection.count_documents(query, limit=1) > 0
+
+
+    def get_server_history(self, server_name: str, start_date: str=None, end_date: str=None) -> List[dict]:
+        # snapshots of a server between two collection names, oldest first, each labelled with its snapshot_date
+        ret = []
+
+        if self.layout == SNAPSHOTS_LAYOUT:
+            query = get_host_dates_query(server_name, start_date, end_date)
+            for doc in self.db_handle[SNAPSHOTS_COLLECTION].find(query, HISTORY_PROJECTION).sort("snapshot_date", ASCENDING):
+                self.__decode_document(doc)
+                ret.append(doc)
+
+            return ret
+
+        for collection_name in self.get_collection_names():
+            if not is_in_date_range(collection_name, start_date, end_date):
+                continue
+
+            doc = self.find_document(collection_name, server_name)
+            if doc is not None:
+                doc["snapshot_date"] = collection_name
+                ret.append(doc)
+
+        return ret
+
+
+    def get_hosts_by_date(self) -> Dict[str, List[str]]:
+        # every listing is a single aggregation, over the snapshots or over the maintained snapshot index
+        return read_hosts_by_date(get_listing_collection(self.db_handle, self.layout).aggregate(HOSTS_BY_DATE_PIPELINE))
+
+
+    def get_dates_by_host(self) -> Dict[str, List[str]]:
+        return read_dates_by_host(get_listing_collection(self.db_handle, self.layout).aggregate(DATES_BY_HOST_PIPELINE))
+
+
+    def get_server_dates(self, server_name: str) -> List[str]:
+        listing_collection = get_listing_collection(self.db_handle, self.layout)
+        cursor = listing_collection.find(get_host_dates_query(server_name), {"_id": False, "snapshot_date": True})
+        return [doc["snapshot_date"] for doc in cursor.sort("snapshot_date", ASCENDING)]
+
+
+    def get_latest_snapshots(self) -> Dict[str, str]:
+        # date of the latest snapshot of every server
+        return read_latest_snapshots(get_listing_collection(self.db_handle, self.layout).aggregate(LATEST_SNAPSHOTS_PIPELINE))
+
+
+    def rebuild_snapshot_index(self) -> int:
+        # fills the snapshot index from the daily collections written before it was maintained
+        ret = 0
+        if self.layout == SNAPSHOTS_LAYOUT:
+            return ret
+
+        for collection_name in self.get_collection_names():
+            hostnames = self.db_handle[collection_name].distinct("system_info.hostname")
+            self.__index_snapshots(collection_name, hostnames)
+            ret += len(hostnames)
+
+        return ret
+
 
     def insert_documents(self, collection_name: str, documents: List[dict]) -> None:
-        self.db_handle[collection_name].insert_many(documents)
+        collection, _ = get_snapshot_query(self.db_handle, self.layout, collection_name)
+        self.__ensure_indexes(collection)
+        collection.insert_many([self.__encode_document(collection_name, document) for document in documents])
+        self.__index_snapshots(collection_name, [document["system_info"]["hostname"] for document in documents])
+
+        if self.track_changes:
+            self.__record_changes(collection_name, documents)
+
+
+    def write_documents(self, collection_name: str, documents: Iterable[dict], batch_size: int=WRITE_BATCH_SIZE,
+                        upsert: bool=False) -> dict:
+        # documents are consumed lazily and flushed in unordered batches, failures are reported per document
+        report = {"inserted": 0, "upserted": 0, "modified": 0, "failed": []}
+        collection, _ = get_snapshot_query(self.db_handle, self.layout, collection_name)
+        self.__ensure_indexes(collection)
+        batch = []
+
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                self.__write_batch(collection, collection_name, batch, upsert, report)
+                batch = []
+
+        if batch:
+            self.__write_batch(collection, collection_name, batch, upsert, report)
+
+        return report
+
+
+    def get_changes(self, server_name: str, start_date: str=None, end_date: str=None) -> List[dict]:
+        # change timeline of a server, oldest first
+        query = get_host_dates_query(server_name, start_date, end_date)
+        cursor = self.db_handle[CHANGES_COLLECTION].find(query, {"_id": False}).sort("snapshot_date", ASCENDING)
+        return [nest_changes(record) for record in cursor]
+
+
+    def get_changes_by_date(self, collection_name: str, details: bool=False) -> List[dict]:
+        # changes of every server on a given day
+        projection = get_changes_projection(details)
+        cursor = self.db_handle[CHANGES_COLLECTION].find({"snapshot_date": collection_name}, projection).sort("hostname", ASCENDING)
+        return [nest_changes(record) for record in cursor]
 
 
     def create_collection(self, collection_name: str) -> None:
+        if self.layout == SNAPSHOTS_LAYOUT:
+            self.__ensure_indexes(self.db_handle[SNAPSHOTS_COLLECTION])
+            return
+
         self.db_handle.create_collection(collection_name)
 
 
     def drop_collection(self, collection_name: str) -> None:
+        if self.layout == SNAPSHOTS_LAYOUT:
+            self.db_handle[SNAPSHOTS_COLLECTION].delete_many({"snapshot_date": collection_name})
+            return
+
         self.db_handle.drop_collection(collection_name)
+        self.db_handle[SNAPSHOT_INDEX_COLLECTION].delete_many({"snapshot_date": collection_name})
 
 
     def get_ddiff(self, document_x: dict, document_y: dict) -> dict:
+        return diff_snapshots(document_x, document_y)
+
+
+    def get_deepdiff(self, document_x: dict, document_y: dict) -> dict:
         ret = {}
 
         ddiff = DeepDiff(document_x, document_y)
@@ -73,14 +230,201 @@ class MongoHelper:
         return ret
 
 
-    def __apply_projection(self, server_info: dict) -> None:
-        system_info = server_info["system_info"]
-        wildfly_info = server_info["wildfly_info"]
+    def __ensure_indexes(self, collection: Collection) -> None:
+        if collection.name in self.__indexed_collections:
+            return
+
+        if collection.name in (SNAPSHOTS_COLLECTION, CHANGES_COLLECTION, SNAPSHOT_INDEX_COLLECTION):
+            collection.create_index([("hostname", ASCENDING), ("snapshot_date", ASCENDING)], unique=True)
+            collection.create_index([("snapshot_date", ASCENDING), ("hostname", ASCENDING)])
+        else:
+            collection.create_index("system_info.hostname")
+
+        self.__indexed_collections.add(collection.name)
+
+
+    def __write_batch(self, collection: Collection, collection_name: str, batch: List[dict], upsert: bool, report: dict) -> None:
+        # documents failing before the server are reported like the ones it rejects, the others are still sent
+        documents = []
+        requests = []
+
+        for document in batch:
+            try:
+                requests.append(self.__build_request(self.__encode_document(collection_name, document), upsert))
+                documents.append(document)
+            except Exception as e:
+                report["failed"].append({"hostname": self.__get_report_hostname(document), "error": f"{type(e).__name__}: {str(e)}"})
+
+        if not requests:
+            return
+
+        # changes are recorded for the documents actually written only
+        written = self.__flush_batch(collection, documents, requests, report)
+
+        if self.track_changes and written:
+            self.__record_changes(collection_name, [documents[index] for index in written])
+
+
+    def __build_request(self, document: dict, upsert: bool) -> Union[InsertOne, ReplaceOne]:
+        # encoded here so that an invalid document doesn't abort the whole bulk write
+        size = len(bson.encode(document))
+        if size > MAX_DOCUMENT_SIZE:
+            raise Exception(f"Document of {size} bytes over the {MAX_DOCUMENT_SIZE} bytes limit")
+
+        if upsert:
+            return ReplaceOne(self.__get_upsert_filter(document), document, upsert=True)
+
+        return InsertOne(document)
+
+
+    def __flush_batch(self, collection: Collection, documents: List[dict], requests: list, report: dict) -> List[int]:
+        failed = set()
+        try:
+            result = collection.bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for error in result["writeErrors"]:
+                failed.add(error["index"])
+                report["failed"].append({"hostname": self.__get_report_hostname(documents[error["index"]]), "error": error["errmsg"]})
+
+        written = [index for index in range(len(documents)) if index not in failed]
+        if written and self.layout == DAILY_LAYOUT:
+            self.__index_snapshots(collection.name, [documents[index]["system_info"]["hostname"] for index in written])
+
+        report["inserted"] += result["nInserted"]
+        report["upserted"] += result["nUpserted"]
+        report["modified"] += result["nModified"]
+
+        return written
+
+
+    def __get_report_hostname(self, document: dict) -> str:
+        system_info = document.get("system_info") if isinstance(document, dict) else None
+        return system_info.get("hostname") if isinstance(system_info, dict) else None
+
+
+    def __index_snapshots(self, collection_name: str, hostnames: List[str]) -> None:
+        # the snapshots layout is listed directly, daily collections keep a (hostname, snapshot_date) index
+        if self.layout == SNAPSHOTS_LAYOUT or not hostnames:
+            return
+
+        snapshot_index = self.db_handle[SNAPSHOT_INDEX_COLLECTION]
+        self.__ensure_indexes(snapshot_index)
+
+        requests = []
+        for hostname in hostnames:
+            entry = {"hostname": hostname.lower(), "snapshot_date": collection_name}
+            requests.append(ReplaceOne(entry, entry, upsert=True))
+        snapshot_index.bulk_write(requests, ordered=False)
+
+
+    def __record_changes(self, collection_name: str, server_infos: List[dict]) -> None:
+        # the diff against the previous snapshot of each server is computed once, at ingest time
+        previous_dates = self.__find_previous_dates(collection_name, [server_info["system_info"]["hostname"] for server_info in server_infos])
+        requests = []
+
+        for server_info in server_infos:
+            server_name = server_info["system_info"]["hostname"].lower()
+            previous_date = previous_dates.get(server_name)
+            previous_info = self.find_document(previous_date, server_name) if previous_date is not None else None
+
+            current_info = dict(server_info)
+            for section in LAZY_SECTIONS:
+                if isinstance(server_info.get(section), dict):
+                    current_info[section] = {key: value for key, value in server_info[section].items() if key != "errors"}
+
+            entries = diff_snapshot_entries(previous_info, current_info) if previous_info is not None else []
+
+            record = {}
+            record["hostname"] = server_name
+            record["snapshot_date"] = collection_name
+            record["previous_date"] = previous_date
+            record["summary"] = {kind: sum(1 for entry in entries if entry["kind"] == kind) for kind in ("changed", "added", "removed")}
+            record["changes"] = entries
+
+            requests.append(ReplaceOne({"hostname": server_name, "snapshot_date": collection_name}, record, upsert=True))
+
+        changes = self.db_handle[CHANGES_COLLECTION]
+        self.__ensure_indexes(changes)
+        changes.bulk_write(requests, ordered=False)
+
+
+    def __find_previous_dates(self, collection_name: str, hostnames: List[str]) -> Dict[str, str]:
+        # latest earlier snapshot date of each server, a single query on the snapshots or on the snapshot index
+        pipeline = get_previous_dates_pipeline(collection_name, hostnames)
+        cursor = get_listing_collection(self.db_handle, self.layout).aggregate(pipeline)
+        return {group["_id"]: group["snapshot_date"] for group in cursor}
+
+
+    def __get_upsert_filter(self, document: dict) -> dict:
+        if self.layout == SNAPSHOTS_LAYOUT:
+            return {"hostname": document["hostname"], "snapshot_date": document["snapshot_date"]}
+
+        return {"system_info.hostname": document["system_info"]["hostname"]}
+
+
+    def __encode_document(self, collection_name: str, server_info: dict) -> dict:
+        # the caller document is left untouched
+        ret = dict(server_info)
+        for section in LAZY_SECTIONS:
+            if isinstance(ret.get(section), dict):
+                ret[section] = dict(ret[section])
+
+        system_info = ret.get("system_info") or {}
+        # every layout stores and indexes the snapshots by hostname
+        if not isinstance(system_info.get("hostname"), str):
+            raise Exception("No system_info.hostname in the document")
+
+        section_hashes = server_info.get(SECTION_HASHES_KEY) or compute_section_hashes(server_info)
+
+        # packages are stored in the compact form when enabled
+        if self.compact_packages and isinstance(system_info.get("packages"), list):
+            system_info["packages"] = encode_packages(system_info["packages"])
+
+        if self.dedupe_sections:
+            ret[SECTION_HASHES_KEY] = section_hashes
+            self.__dedupe_sections(ret, section_hashes)
+
+        if self.layout == SNAPSHOTS_LAYOUT:
+            ret["hostname"] = system_info["hostname"].lower()
+            ret["snapshot_date"] = collection_name
+
+        return ret
+
+
+    def __dedupe_sections(self, server_info: dict, section_hashes: dict) -> None:
+        # identical sections are stored once in the sections collection and referenced by content hash
+        new_sections = {}
+
+        for module_name, section_name, value in list(iter_sections(server_info)):
+            section_hash = section_hashes.get(module_name, {}).get(section_name)
+            if section_hash is None or value is None:
+                continue
+
+            if section_hash not in self.__stored_sections:
+                new_sections[section_hash] = value
+            server_info[module_name][section_name] = {SECTION_REF_KEY: section_hash}
+
+        if new_sections:
+            requests = [
+                UpdateOne({"_id": section_hash}, {"$setOnInsert": {"value": value}}, upsert=True)
+                for section_hash, value in new_sections.items()
+            ]
+            self.db_handle[SECTIONS_COLLECTION].bulk_write(requests, ordered=False)
+            self.__stored_sections.update(new_sections.keys())
+
+
+    def __decode_document(self, server_info: dict) -> None:
+        section_hashes = get_section_refs(server_info)
+        section_values = {}
+
+        if section_hashes:
+            cursor = self.db_handle[SECTIONS_COLLECTION].find({"_id": {"$in": section_hashes}})
+            section_values = {section["_id"]: section["value"] for section in cursor}
+
+        decode_document(server_info, section_values)
 
-        system_info.pop("errors", None)
-        wildfly_info.pop("errors", None)
 
-    
     def __get_dict(self, ddiff: DeepDiff, entry_key: str, value_src: dict) -> dict:
         ret = {}
 
@@ -97,4 +441,75 @@ class MongoHelper:
                     entry[subkey] = entry.setdefault(subkey, {}) if idx < len(subkeys) - 1 else value
                     entry = entry[subkey]
         
-        return ret
\ No newline at end of file
+        return ret
+
+
+class LazyDocument(Mapping):
+
+
+    def __init__(self, mongo_helper: MongoHelper, collection_name: str, server_name: str, path: str=""):
+        self.mongo_helper = mongo_helper
+        self.collection_name = collection_name
+        self.server_name = server_name
+        self.path = path
+        self.__values = {}
+        self.__keys = None
+
+
+    def __getitem__(self, key: str):
+        # sections are fetched on first access, module sections are themselves lazy
+        if key not in self.__values:
+            section = f"{self.path}.{key}" if self.path else key
+
+            if not self.path and key in LAZY_SECTIONS:
+                if not self.mongo_helper.has_section(self.collection_name, self.server_name, section):
+                    raise KeyError(key)
+                self.__values[key] = LazyDocument(self.mongo_helper, self.collection_name, self.server_name, section)
+            else:
+                self.__values[key] = self.__fetch(section, key)
+
+        return self.__values[key]
+
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__get_keys())
+
+
+    def __len__(self) -> int:
+        return len(self.__get_keys())
+
+
+    def __get_keys(self) -> List[str]:
+        # listing the keys requires the whole section
+        if self.__keys is None:
+            if self.path:
+                doc = self.mongo_helper.find_document(self.collection_name, self.server_name, [self.path])
+                section = self.__walk(doc, self.path)[1] or {}
+                for key, value in section.items():
+                    self.__values.setdefault(key, value)
+                self.__keys = list(section.keys())
+            else:
+                doc = self.mongo_helper.find_document(self.collection_name, self.server_name) or {}
+                self.__keys = list(doc.keys())
+
+        return self.__keys
+
+
+    def __fetch(self, section: str, key: str):
+        doc = self.mongo_helper.find_document(self.collection_name, self.server_name, [section])
+        found, value = self.__walk(doc, section)
+
+        if not found:
+            raise KeyError(key)
+
+        return value
+
+
+    def __walk(self, doc: dict, path: str) -> Tuple[bool, object]:
+        value = doc
+        for key in path.split("."):
+            if not isinstance(value, dict) or key not in value:
+                return False, None
+            value = value[key]
+
+        return True, value
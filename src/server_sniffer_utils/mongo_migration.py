@@ -0,0 +1,48 @@
+import argparse
+import json
+from typing import Dict
+
+from mongo_helper import DAILY_LAYOUT, SNAPSHOTS_LAYOUT, WRITE_BATCH_SIZE, MongoHelper
+
+
+def migrate_daily_collections(source: MongoHelper, target: MongoHelper, drop_daily: bool=False,
+                              batch_size: int=WRITE_BATCH_SIZE) -> Dict[str, dict]:
+    # every per-day collection is copied into the snapshots collection, re-running the migration is safe
+    ret = {}
+
+    for collection_name in sorted(source.get_collection_names()):
+        try:
+            source.get_collection_date(collection_name)
+        except ValueError:
+            continue
+
+        documents = source.db_handle[collection_name].find({}, {"_id": False})
+        report = target.write_documents(collection_name, documents, batch_size, upsert=True)
+        ret[collection_name] = report
+
+        if drop_daily and not report["failed"]:
+            source.drop_collection(collection_name)
+
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate per-day snapshot collections to the snapshots collection")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="27017")
+    parser.add_argument("--username", default="")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE)
+    parser.add_argument("--drop-daily", action="store_true")
+    args = parser.parse_args()
+
+    source = MongoHelper(args.db, args.host, args.port, args.username, args.password, layout=DAILY_LAYOUT)
+    target = MongoHelper(args.db, args.host, args.port, args.username, args.password, layout=SNAPSHOTS_LAYOUT)
+    reports = migrate_daily_collections(source, target, args.drop_daily, args.batch_size)
+
+    print(json.dumps(reports, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from typing import Dict, List, Union
+
+COMPACT_ENCODING = "columnar-v1"
+
+
+def expand_packages(packages: Dict[str, list]) -> List[dict]:
+    # columnar rpm data returned by system_info, converted to the snapshot package entries
+    ret = []
+    columns = zip(packages["name"], packages["epoch"], packages["version"], packages["release"], packages["arch"],
+                  packages["repository"])
+
+    for name, epoch, version, release, arch, repository in columns:
+        entry = {}
+        entry["pkg_name"] = f"{name}.{arch}"
+        entry["version"] = f"{epoch}:{version}-{release}" if epoch and epoch != "0" else f"{version}-{release}"
+        entry["repository"] = repository
+
+        ret.append(entry)
+
+    return sorted(ret, key=lambda entry: entry["pkg_name"])
+
+
+def encode_packages(packages: List[dict]) -> Union[dict, List[dict]]:
+    # parallel arrays, with the few distinct repository names dictionary encoded
+    if not packages or any(entry.keys() != packages[0].keys() for entry in packages):
+        return packages
+
+    ret = {"_encoding": COMPACT_ENCODING}
+    columns = [column for column in packages[0].keys() if column != "repository"]
+
+    for column in columns:
+        ret[column] = [entry[column] for entry in packages]
+
+    if "repository" in packages[0]:
+        repositories = sorted({entry["repository"] for entry in packages}, key=str)
+        repository_index = {repository: idx for idx, repository in enumerate(repositories)}
+        ret["repositories"] = repositories
+        ret["repository"] = [repository_index[entry["repository"]] for entry in packages]
+
+    return ret
+
+
+def decode_packages(packages: Union[dict, List[dict], None]) -> Union[List[dict], None]:
+    if not is_compact_packages(packages):
+        return packages
+
+    ret = []
+    columns = [column for column in packages.keys() if column not in ("_encoding", "repositories")]
+    repositories = packages.get("repositories", [])
+
+    for values in zip(*(packages[column] for column in columns)):
+        entry = dict(zip(columns, values))
+        if "repository" in entry:
+            entry["repository"] = repositories[entry["repository"]]
+        ret.append(entry)
+
+    return ret
+
+
+def is_compact_packages(packages) -> bool:
+    return isinstance(packages, dict) and packages.get("_encoding") == COMPACT_ENCODING
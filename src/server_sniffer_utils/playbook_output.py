@@ -0,0 +1,195 @@
+import asyncio
+import json
+from typing import BinaryIO, Dict, Generator, List, Tuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# output of the json stdout callback: {"plays": [{"tasks": [{"hosts": {host: result}, "task": {"name": ...}}]}]}
+TASK_PREFIX = "plays.item.tasks.item"
+TASK_NAME_PREFIX = "plays.item.tasks.item.task.name"
+HOSTS_PREFIX = "plays.item.tasks.item.hosts"
+RESULT_KEYS = {"changed", "failed", "msg", "skipped", "unreachable"}
+INTERFACES_FACT = "ansible_interfaces"
+READ_CHUNK_SIZE = 64 * 1024
+
+# parser events sent to the consumers below: (prefix, event, value)
+Consumer = Generator[None, Tuple[str, str, object], object]
+
+
+def read_playbook_results(stream: BinaryIO, module_keys: List[str], fact_keys: List[str]) -> Dict[str, Dict[str, dict]]:
+    # results of each task by host, only the module payloads and the wanted facts are decoded
+    if ijson is not None:
+        return stream_playbook_results(stream, set(module_keys), set(fact_keys))
+
+    return decode_playbook_output(stream.read(), set(module_keys), set(fact_keys))
+
+
+async def read_playbook_results_async(stream: asyncio.StreamReader, module_keys: List[str], fact_keys: List[str]) -> Dict[str, Dict[str, dict]]:
+    # the output is pushed to the parser as it arrives, the event loop is never blocked waiting for it
+    if ijson is None:
+        return decode_playbook_output(await stream.read(), set(module_keys), set(fact_keys))
+
+    ret = {}
+    parser = ijson.parse_coro(start_consumer(consume_playbook_events(ret, set(module_keys), set(fact_keys))), use_float=True)
+
+    chunk = await stream.read(READ_CHUNK_SIZE)
+    while chunk:
+        parser.send(chunk)
+        chunk = await stream.read(READ_CHUNK_SIZE)
+    parser.close()
+
+    return ret
+
+
+def decode_playbook_output(data: bytes, module_keys: set, fact_keys: set) -> Dict[str, Dict[str, dict]]:
+    playbook_output = orjson.loads(data) if orjson is not None else json.loads(data)
+    return demux_playbook_results(playbook_output, module_keys, fact_keys)
+
+
+def demux_playbook_results(playbook_output: dict, module_keys: set, fact_keys: set) -> Dict[str, Dict[str, dict]]:
+    ret = {}
+
+    for play in playbook_output["plays"]:
+        for task in play["tasks"]:
+            task_name = task["task"]["name"]
+            for server_name, result in task["hosts"].items():
+                ret.setdefault(server_name, {})[task_name] = filter_result(result, module_keys, fact_keys)
+
+    return ret
+
+
+def filter_result(result: dict, module_keys: set, fact_keys: set) -> dict:
+    ret = {key: value for key, value in result.items() if key in RESULT_KEYS or key in module_keys}
+
+    if isinstance(ret.get("ansible_facts"), dict):
+        ret["ansible_facts"] = filter_facts(ret["ansible_facts"], fact_keys)
+
+    return ret
+
+
+def filter_facts(ansible_facts: dict, fact_keys: set) -> dict:
+    # the whitelisted facts, plus one fact per network interface
+    interface_keys = {f"ansible_{interface_name}" for interface_name in ansible_facts.get(INTERFACES_FACT) or []}
+    return {
+        key: value for key, value in ansible_facts.items()
+        if key in fact_keys or key == INTERFACES_FACT or key in interface_keys
+    }
+
+
+def stream_playbook_results(stream: BinaryIO, module_keys: set, fact_keys: set) -> Dict[str, Dict[str, dict]]:
+    # the output is decoded while it is read, host results are built one at a time and skipped keys never are
+    ret = {}
+    consumer = start_consumer(consume_playbook_events(ret, module_keys, fact_keys))
+
+    for event in ijson.parse(stream, use_float=True):
+        consumer.send(event)
+
+    return ret
+
+
+def start_consumer(consumer: Consumer) -> Consumer:
+    # the consumers are generators, pulled and pushed parser events are decoded by the same code
+    next(consumer)
+    return consumer
+
+
+def consume_playbook_events(ret: Dict[str, Dict[str, dict]], module_keys: set, fact_keys: set) -> Consumer:
+    task_name = None
+    task_results = {}
+
+    # the callback sorts the keys, the hosts of a task come before its name and are kept until the task ends
+    while True:
+        prefix, event, value = yield
+        if prefix == TASK_PREFIX and event == "start_map":
+            task_name = None
+            task_results = {}
+        elif prefix == TASK_NAME_PREFIX and event == "string":
+            task_name = value
+        elif prefix == HOSTS_PREFIX and event == "map_key":
+            task_results[value] = yield from read_host_result(module_keys, fact_keys)
+        elif prefix == TASK_PREFIX and event == "end_map":
+            for server_name, result in task_results.items():
+                ret.setdefault(server_name, {})[task_name] = result
+
+
+def read_host_result(module_keys: set, fact_keys: set) -> Consumer:
+    ret = {}
+    yield from expect_event("start_map")
+
+    while True:
+        _, event, key = yield
+        if event == "end_map":
+            return ret
+
+        if key == "ansible_facts":
+            ret[key] = yield from read_facts(fact_keys)
+        elif key in RESULT_KEYS or key in module_keys:
+            ret[key] = yield from build_value()
+        else:
+            yield from skip_value()
+
+
+def read_facts(fact_keys: set) -> Consumer:
+    ret = {}
+    yield from expect_event("start_map")
+
+    # interface facts follow the interface list, until it is known any map may be an interface fact
+    while True:
+        _, event, key = yield
+        if event == "end_map":
+            return filter_facts(ret, fact_keys)
+
+        if key in fact_keys or key == INTERFACES_FACT:
+            ret[key] = yield from build_value()
+        elif key.startswith("ansible_") and INTERFACES_FACT not in ret:
+            value = yield from build_value()
+            if isinstance(value, dict) and "device" in value:
+                ret[key] = value
+        elif key.startswith("ansible_") and key[len("ansible_"):] in ret[INTERFACES_FACT]:
+            ret[key] = yield from build_value()
+        else:
+            yield from skip_value()
+
+
+def build_value() -> Consumer:
+    builder = ijson.ObjectBuilder()
+    depth = 0
+
+    while True:
+        _, event, value = yield
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+
+        if depth == 0:
+            return builder.value
+
+
+def skip_value() -> Consumer:
+    depth = 0
+
+    while True:
+        _, event, _ = yield
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+
+        if depth == 0:
+            return
+
+
+def expect_event(expected: str) -> Consumer:
+    _, event, _ = yield
+    if event != expected:
+        raise Exception(f"Unexpected ansible output: {event} instead of {expected}")
@@ -0,0 +1,169 @@
+from typing import Callable, Dict, Hashable, List, Tuple, Union
+
+from snapshot_sections import SECTION_HASHES_KEY, TIMINGS_KEY, get_section_hash, hash_section, iter_sections
+
+# keys identifying the items of snapshot lists, in order of preference
+# mount facts carry a device too, shared by the tmpfs, overlay and bind mounts, the mount point comes first
+NATURAL_KEYS = ["pkg_name", "jndi_name", "sha1", "mount", "device", "role_name", "file_name"]
+IGNORED_KEYS = {"fingerprints", SECTION_HASHES_KEY, TIMINGS_KEY}
+
+
+DIFF_KINDS = {"changed": "items_changed", "added": "items_added", "removed": "items_removed"}
+
+
+def diff_snapshots(document_x: dict, document_y: dict) -> dict:
+    # nested dicts of the changed, added and removed items, with list items keyed by their natural key
+    return nest_diff_entries(diff_snapshot_entries(document_x, document_y))
+
+
+def diff_snapshot_entries(document_x: dict, document_y: dict) -> List[dict]:
+    # flat {kind, path, value} entries, suitable for storage since the path is not used as a key
+    # a missing document is diffed as an empty one, every section of the other is then added or removed
+    ret = []
+    document_x = {} if document_x is None else document_x
+    document_y = {} if document_y is None else document_y
+    document_x, document_y = skip_equal_sections(document_x, document_y)
+    diff_values(document_x, document_y, [], ret)
+    return ret
+
+
+def skip_equal_sections(document_x: dict, document_y: dict) -> Tuple[dict, dict]:
+    # sections with the same content hash are dropped from shallow copies of both documents
+    equal_sections = []
+    for module_name, section_name, _ in iter_sections(document_x):
+        section_hash = get_section_hash(document_x, module_name, section_name)
+        if section_hash is not None and section_hash == get_section_hash(document_y, module_name, section_name):
+            equal_sections.append((module_name, section_name))
+
+    if not equal_sections:
+        return document_x, document_y
+
+    document_x = dict(document_x)
+    document_y = dict(document_y)
+
+    for module_name, section_name in equal_sections:
+        for document in (document_x, document_y):
+            if isinstance(document.get(module_name), dict):
+                document[module_name] = {key: value for key, value in document[module_name].items() if key != section_name}
+
+    return document_x, document_y
+
+
+def nest_diff_entries(entries: List[dict]) -> Dict[str, dict]:
+    ret = {items_key: {} for items_key in DIFF_KINDS.values()}
+
+    for entry in entries:
+        set_path(ret[DIFF_KINDS[entry["kind"]]], entry["path"], entry["value"])
+
+    return ret
+
+
+def diff_values(value_x, value_y, path: List[str], ret: List[dict]) -> None:
+    if value_x == value_y:
+        return
+
+    if isinstance(value_x, dict) and isinstance(value_y, dict):
+        diff_dicts(value_x, value_y, path, ret)
+    elif isinstance(value_x, list) and isinstance(value_y, list):
+        diff_lists(value_x, value_y, path, ret)
+    else:
+        ret.append(diff_entry("changed", path, value_y))
+
+
+def diff_dicts(dict_x: dict, dict_y: dict, path: List[str], ret: List[dict]) -> None:
+    for key, value_x in dict_x.items():
+        if key in IGNORED_KEYS:
+            continue
+
+        if key not in dict_y:
+            ret.append(diff_entry("removed", path + [key], value_x))
+        else:
+            diff_values(value_x, dict_y[key], path + [key], ret)
+
+    for key, value_y in dict_y.items():
+        if key not in dict_x and key not in IGNORED_KEYS:
+            ret.append(diff_entry("added", path + [key], value_y))
+
+
+def diff_lists(list_x: list, list_y: list, path: List[str], ret: List[dict]) -> None:
+    natural_key = find_natural_key(list_x, list_y)
+
+    if natural_key is not None:
+        diff_keyed_lists(list_x, list_y, natural_key, path, ret)
+    elif all(isinstance(item, Hashable) for item in list_x + list_y):
+        # lists of scalars are compared as sets
+        diff_item_sets(list_x, list_y, path, ret, lambda item: item)
+    else:
+        ret.append(diff_entry("changed", path, list_y))
+
+
+def diff_keyed_lists(list_x: list, list_y: list, natural_key: str, path: List[str], ret: List[dict]) -> None:
+    # items sharing a natural key, like installonly kernels or gpg-pubkey, are grouped under it
+    # and compared as sets of whole items, the uniquely keyed ones are diffed field by field
+    groups_x = group_items(list_x, natural_key)
+    groups_y = group_items(list_y, natural_key)
+
+    for key, items_x in groups_x.items():
+        if key not in groups_y:
+            ret.append(diff_entry("removed", path + [key], unwrap_group(items_x)))
+        elif len(items_x) == 1 and len(groups_y[key]) == 1:
+            diff_values(items_x[0], groups_y[key][0], path + [key], ret)
+        else:
+            diff_item_sets(items_x, groups_y[key], path + [key], ret, hash_section)
+
+    for key, items_y in groups_y.items():
+        if key not in groups_x:
+            ret.append(diff_entry("added", path + [key], unwrap_group(items_y)))
+
+
+def diff_item_sets(list_x: list, list_y: list, path: List[str], ret: List[dict], identify: Callable) -> None:
+    items_x = {identify(item) for item in list_x}
+    items_y = {identify(item) for item in list_y}
+    added = [item for item in list_y if identify(item) not in items_x]
+    removed = [item for item in list_x if identify(item) not in items_y]
+
+    if added:
+        ret.append(diff_entry("added", path, added))
+    if removed:
+        ret.append(diff_entry("removed", path, removed))
+
+
+def find_natural_key(list_x: list, list_y: list) -> Union[str, None]:
+    # the first key carried by every item, it doesn't have to be unique
+    items = list_x + list_y
+
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+
+    for key in NATURAL_KEYS:
+        if all(key in item for item in items):
+            return key
+
+    return None
+
+
+def group_items(items: List[dict], natural_key: str) -> Dict[str, List[dict]]:
+    ret = {}
+
+    for item in items:
+        ret.setdefault(str(item[natural_key]), []).append(item)
+
+    return ret
+
+
+def unwrap_group(items: List[dict]) -> Union[dict, List[dict]]:
+    return items[0] if len(items) == 1 else items
+
+
+def diff_entry(kind: str, path: List[str], value) -> dict:
+    return {"kind": kind, "path": path, "value": value}
+
+
+def set_path(target: dict, path: List[str], value) -> None:
+    # a change of the whole document, only possible when one of them isn't a dict, is reported under root
+    path = path or ["root"]
+
+    for key in path[:-1]:
+        target = target.setdefault(key, {})
+
+    target[path[-1]] = value
@@ -0,0 +1,169 @@
+import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+from packages import decode_packages
+from snapshot_diff import nest_diff_entries
+from snapshot_sections import iter_sections
+
+DATE_FORMAT = "%Y-%m-%d"
+DAILY_LAYOUT = "daily"
+SNAPSHOTS_LAYOUT = "snapshots"
+SNAPSHOTS_COLLECTION = "snapshots"
+CHANGES_COLLECTION = "changes"
+SECTIONS_COLLECTION = "sections"
+SNAPSHOT_INDEX_COLLECTION = "snapshot_index"
+SECTION_REF_KEY = "_section_ref"
+LAZY_SECTIONS = ["system_info", "wildfly_info"]
+HISTORY_PROJECTION = {"_id": False, "hostname": False}
+# listings run over the snapshots collection or over the snapshot index, both have hostname and snapshot_date
+# they start with a sort on one of the (hostname, snapshot_date) indexes and only keep its keys, the scan is then
+# covered by the index and the snapshot documents themselves are never read
+LISTING_PROJECTION = {"$project": {"_id": False, "hostname": True, "snapshot_date": True}}
+HOSTS_BY_DATE_PIPELINE = [
+    {"$sort": {"snapshot_date": ASCENDING, "hostname": ASCENDING}},
+    LISTING_PROJECTION,
+    {"$group": {"_id": "$snapshot_date", "hostnames": {"$push": "$hostname"}}},
+    {"$sort": {"_id": ASCENDING}},
+]
+DATES_BY_HOST_PIPELINE = [
+    {"$sort": {"hostname": ASCENDING, "snapshot_date": ASCENDING}},
+    LISTING_PROJECTION,
+    {"$group": {"_id": "$hostname", "snapshot_dates": {"$push": "$snapshot_date"}}},
+    {"$sort": {"_id": ASCENDING}},
+]
+# the first date of each host in descending order, read with a distinct scan of the index
+LATEST_SNAPSHOTS_PIPELINE = [
+    {"$sort": {"hostname": DESCENDING, "snapshot_date": DESCENDING}},
+    {"$group": {"_id": "$hostname", "snapshot_date": {"$first": "$snapshot_date"}}},
+    {"$sort": {"_id": ASCENDING}},
+]
+
+
+def get_snapshot_query(db_handle, layout: str, collection_name: str, server_name: str=None) -> Tuple[object, dict]:
+    if layout == SNAPSHOTS_LAYOUT:
+        query = {"snapshot_date": collection_name}
+        if server_name is not None:
+            query["hostname"] = server_name.lower()
+        return db_handle[SNAPSHOTS_COLLECTION], query
+
+    query = {}
+    if server_name is not None:
+        query["system_info.hostname"] = server_name.lower()
+    return db_handle[collection_name], query
+
+
+def get_snapshot_projection(layout: str, sections: List[str]=None) -> dict:
+    # inclusion and exclusion can't be mixed, a list of sections is projected by inclusion only
+    if sections:
+        ret = {section: True for section in sections}
+        ret["_id"] = False
+        return ret
+
+    ret = {"_id": False}
+    for section in LAZY_SECTIONS:
+        ret[f"{section}.errors"] = False
+
+    if layout == SNAPSHOTS_LAYOUT:
+        ret["hostname"] = False
+        ret["snapshot_date"] = False
+
+    return ret
+
+
+def get_listing_collection(db_handle, layout: str):
+    if layout == SNAPSHOTS_LAYOUT:
+        return db_handle[SNAPSHOTS_COLLECTION]
+
+    return db_handle[SNAPSHOT_INDEX_COLLECTION]
+
+
+def get_date_range(start_date: str=None, end_date: str=None) -> dict:
+    ret = {}
+    if start_date:
+        ret["$gte"] = start_date
+    if end_date:
+        ret["$lte"] = end_date
+    return ret
+
+
+def get_host_dates_query(server_name: str, start_date: str=None, end_date: str=None) -> dict:
+    # snapshots and changes of a server between two collection names
+    ret = {"hostname": server_name.lower()}
+    date_range = get_date_range(start_date, end_date)
+    if date_range:
+        ret["snapshot_date"] = date_range
+    return ret
+
+
+def get_changes_projection(details: bool) -> dict:
+    # only the summaries unless details are requested
+    return {"_id": False} if details else {"_id": False, "changes": False}
+
+
+def get_previous_dates_pipeline(collection_name: str, hostnames: List[str]) -> List[dict]:
+    # latest snapshot date of each server before the given one
+    return [
+        {"$match": {"hostname": {"$in": [hostname.lower() for hostname in hostnames]}, "snapshot_date": {"$lt": collection_name}}},
+        {"$group": {"_id": "$hostname", "snapshot_date": {"$max": "$snapshot_date"}}},
+    ]
+
+
+def get_daily_collection_names(collection_names: Iterable[str]) -> List[str]:
+    # the snapshot index and the other bookkeeping collections aren't snapshot days
+    ret = []
+
+    for collection_name in collection_names:
+        try:
+            datetime.datetime.strptime(collection_name, DATE_FORMAT)
+            ret.append(collection_name)
+        except ValueError:
+            continue
+
+    return sorted(ret)
+
+
+def is_in_date_range(collection_name: str, start_date: str=None, end_date: str=None) -> bool:
+    return not ((start_date and collection_name < start_date) or (end_date and collection_name > end_date))
+
+
+def read_hosts_by_date(groups: Iterable[dict]) -> Dict[str, List[str]]:
+    return {group["_id"]: sorted(hostname.upper() for hostname in group["hostnames"]) for group in groups}
+
+
+def read_dates_by_host(groups: Iterable[dict]) -> Dict[str, List[str]]:
+    return {group["_id"].upper(): sorted(group["snapshot_dates"]) for group in groups}
+
+
+def read_latest_snapshots(groups: Iterable[dict]) -> Dict[str, str]:
+    return {group["_id"].upper(): group["snapshot_date"] for group in groups}
+
+
+def get_section_refs(server_info: dict) -> List[str]:
+    # content hashes of the sections stored apart by the dedupe, to be fetched before decode_document
+    return sorted({
+        value[SECTION_REF_KEY] for _, _, value in iter_sections(server_info)
+        if isinstance(value, dict) and SECTION_REF_KEY in value
+    })
+
+
+def decode_document(server_info: dict, section_values: Dict[str, object]) -> None:
+    # errors are excluded server side, except when a whole module section is requested
+    for section in LAZY_SECTIONS:
+        if isinstance(server_info.get(section), dict):
+            server_info[section].pop("errors", None)
+
+    for module_name, section_name, value in list(iter_sections(server_info)):
+        if isinstance(value, dict) and SECTION_REF_KEY in value:
+            server_info[module_name][section_name] = section_values.get(value[SECTION_REF_KEY])
+
+    system_info = server_info.get("system_info") or {}
+    if "packages" in system_info:
+        system_info["packages"] = decode_packages(system_info["packages"])
+
+
+def nest_changes(record: dict) -> dict:
+    if "changes" in record:
+        record["changes"] = nest_diff_entries(record["changes"])
+    return record
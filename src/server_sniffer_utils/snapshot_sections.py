@@ -0,0 +1,41 @@
+import hashlib
+import json
+from typing import Dict, Iterator, Tuple
+
+SECTION_HASHES_KEY = "section_hashes"
+TIMINGS_KEY = "_timings"
+HASHED_SECTIONS = {
+    "system_info": ["packages", "logrotate_configuration", "interfaces", "mounts", "devices"],
+    "wildfly_info": ["deployments", "datasources", "users", "log_files"],
+}
+
+
+def hash_section(value) -> str:
+    # stable across runs: keys are sorted and the separators fixed
+    serialized = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+
+def compute_section_hashes(server_info: dict) -> Dict[str, Dict[str, str]]:
+    # hashes are nested like the snapshot itself, section paths can't be used as document keys
+    ret = {}
+
+    for module_name, section_name, value in iter_sections(server_info):
+        ret.setdefault(module_name, {})[section_name] = hash_section(value)
+
+    return ret
+
+
+def iter_sections(server_info: dict) -> Iterator[Tuple[str, str, object]]:
+    for module_name, section_names in HASHED_SECTIONS.items():
+        module_info = server_info.get(module_name)
+        if not isinstance(module_info, dict):
+            continue
+
+        for section_name in section_names:
+            if section_name in module_info:
+                yield module_name, section_name, module_info[section_name]
+
+
+def get_section_hash(server_info: dict, module_name: str, section_name: str) -> str:
+    return ((server_info.get(SECTION_HASHES_KEY) or {}).get(module_name) or {}).get(section_name)
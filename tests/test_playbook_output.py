@@ -0,0 +1,112 @@
+import asyncio
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "server_sniffer_utils"))
+
+import playbook_output
+from playbook_output import read_playbook_results, read_playbook_results_async
+
+MODULE_KEYS = ["ansible_facts", "system_info", "wildfly_info"]
+FACT_KEYS = ["ansible_hostname", "ansible_mounts"]
+
+
+def get_playbook_output() -> dict:
+    # two hosts and three tasks, with facts and keys the gatherer doesn't keep
+    facts = {
+        "ansible_hostname": "host-a",
+        "ansible_mounts": [{"mount": "/", "size_total": 10 ** 9}],
+        "ansible_interfaces": ["eth0", "lo"],
+        "ansible_eth0": {"device": "eth0", "mtu": 1500},
+        "ansible_lo": {"device": "lo", "mtu": 65536},
+        "ansible_env": {"HOME": "/root"},
+        "ansible_selinux": {"status": "disabled"},
+    }
+
+    tasks = [
+        {
+            "task": {"name": "gather_facts", "id": "1", "duration": {"start": "0", "end": "1"}},
+            "hosts": {
+                "host-a": {"changed": False, "ansible_facts": facts, "invocation": {"module_args": {}}},
+                "host-b": {"unreachable": True, "msg": "ssh timeout"},
+            },
+        },
+        {
+            "task": {"name": "system_info", "id": "2"},
+            "hosts": {
+                "host-a": {"changed": False, "system_info": {"packages": [1, 2.5]}, "_ansible_no_log": False},
+            },
+        },
+        {
+            "task": {"name": "wildfly_info", "id": "3"},
+            "hosts": {
+                "host-a": {"failed": True, "msg": "no standalone.xml", "wildfly_info": {"errors": ["missing"]}},
+            },
+        },
+    ]
+
+    return {"custom_stats": {}, "global_custom_stats": {}, "plays": [{"play": {"name": "sniffer"}, "tasks": tasks}], "stats": {}}
+
+
+def get_expected_results() -> dict:
+    ret = {"host-a": {}, "host-b": {}}
+
+    ret["host-a"]["gather_facts"] = {
+        "changed": False,
+        "ansible_facts": {
+            "ansible_hostname": "host-a",
+            "ansible_mounts": [{"mount": "/", "size_total": 10 ** 9}],
+            "ansible_interfaces": ["eth0", "lo"],
+            "ansible_eth0": {"device": "eth0", "mtu": 1500},
+            "ansible_lo": {"device": "lo", "mtu": 65536},
+        },
+    }
+    ret["host-a"]["system_info"] = {"changed": False, "system_info": {"packages": [1, 2.5]}}
+    ret["host-a"]["wildfly_info"] = {"failed": True, "msg": "no standalone.xml", "wildfly_info": {"errors": ["missing"]}}
+    ret["host-b"]["gather_facts"] = {"unreachable": True, "msg": "ssh timeout"}
+
+    return ret
+
+
+@pytest.fixture(params=["ijson", "json"])
+def parser(request, monkeypatch):
+    # the streaming parser when ijson is installed, the whole document is decoded otherwise
+    if request.param == "ijson":
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setattr(playbook_output, "ijson", None)
+    return request.param
+
+
+def read_results(output: bytes, reader: str) -> dict:
+    if reader == "stream":
+        return read_playbook_results(io.BytesIO(output), MODULE_KEYS, FACT_KEYS)
+
+    async def read_async():
+        # the output arrives in small chunks, values are split across them
+        stream = asyncio.StreamReader()
+        for start in range(0, len(output), 7):
+            stream.feed_data(output[start:start + 7])
+        stream.feed_eof()
+        return await read_playbook_results_async(stream, MODULE_KEYS, FACT_KEYS)
+
+    return asyncio.run(read_async())
+
+
+@pytest.mark.parametrize("reader", ["stream", "async"])
+@pytest.mark.parametrize("sort_keys", [True, False])
+def test_read_playbook_results(parser, reader, sort_keys):
+    # the json callback sorts the keys, the hosts of each task are written before its name
+    output = json.dumps(get_playbook_output(), sort_keys=sort_keys, indent=4).encode("utf-8")
+    assert read_results(output, reader) == get_expected_results()
+
+
+@pytest.mark.parametrize("reader", ["stream", "async"])
+def test_read_playbook_results_truncated(parser, reader):
+    output = json.dumps(get_playbook_output(), sort_keys=True, indent=4).encode("utf-8")
+    with pytest.raises(Exception):
+        read_results(output[:len(output) // 2], reader)
@@ -0,0 +1,183 @@
+import copy
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "server_sniffer_utils"))
+
+from snapshot_diff import diff_snapshot_entries, diff_snapshots, find_natural_key
+from snapshot_sections import SECTION_HASHES_KEY, TIMINGS_KEY, compute_section_hashes
+
+
+def get_snapshot() -> dict:
+    ret = {"system_info": {}, "wildfly_info": {}}
+
+    system_info = ret["system_info"]
+    system_info["hostname"] = "host-a"
+    system_info["packages"] = [
+        {"pkg_name": "bash.x86_64", "version": "5.1-1.el9", "repository": "@baseos"},
+        {"pkg_name": "kernel.x86_64", "version": "5.14-1.el9", "repository": "@baseos"},
+        {"pkg_name": "kernel.x86_64", "version": "5.14-2.el9", "repository": "@baseos"},
+        {"pkg_name": "vim.x86_64", "version": "9.0-1.el9", "repository": "@appstream"},
+    ]
+    system_info["mounts"] = [
+        {"mount": "/", "device": "/dev/sda1", "size_available": 100},
+        {"mount": "/run", "device": "tmpfs", "size_available": 200},
+        {"mount": "/dev/shm", "device": "tmpfs", "size_available": 300},
+    ]
+    system_info["interfaces"] = [{"device": "eth0", "mtu": 1500}, {"device": "lo", "mtu": 65536}]
+
+    wildfly_info = ret["wildfly_info"]
+    wildfly_info["deployments"] = [{"sha1": "a" * 40, "deploment_name": "app.ear", "roles": ["admin", "user"]}]
+
+    return ret
+
+
+def test_equal_snapshots():
+    snapshot = get_snapshot()
+    assert diff_snapshot_entries(snapshot, copy.deepcopy(snapshot)) == []
+
+
+def test_keyed_list_field_change():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["packages"][0]["version"] = "5.1-2.el9"
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "changed", "path": ["system_info", "packages", "bash.x86_64", "version"], "value": "5.1-2.el9"},
+    ]
+
+
+def test_keyed_list_added_and_removed():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    vim = snapshot_y["system_info"]["packages"].pop()
+    git = {"pkg_name": "git.x86_64", "version": "2.39-1.el9", "repository": "@appstream"}
+    snapshot_y["system_info"]["packages"].insert(0, git)
+
+    ret = diff_snapshots(snapshot_x, snapshot_y)
+    assert ret["items_changed"] == {}
+    assert ret["items_added"] == {"system_info": {"packages": {"git.x86_64": git}}}
+    assert ret["items_removed"] == {"system_info": {"packages": {"vim.x86_64": vim}}}
+
+
+def test_mounts_keyed_by_mount_point():
+    # mounts sharing a device, like tmpfs, are still diffed field by field
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["mounts"][1]["size_available"] = 150
+
+    assert find_natural_key(snapshot_x["system_info"]["mounts"], []) == "mount"
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "changed", "path": ["system_info", "mounts", "/run", "size_available"], "value": 150},
+    ]
+
+
+def test_interfaces_keyed_by_device():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["interfaces"][0]["mtu"] = 9000
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "changed", "path": ["system_info", "interfaces", "eth0", "mtu"], "value": 9000},
+    ]
+
+
+def test_duplicate_keys_compared_as_sets():
+    # installonly packages share their name, the group is compared as a set of whole items
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    packages = snapshot_y["system_info"]["packages"]
+    old_kernel = packages.pop(1)
+    new_kernel = {"pkg_name": "kernel.x86_64", "version": "5.14-3.el9", "repository": "@baseos"}
+    packages.append(new_kernel)
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "added", "path": ["system_info", "packages", "kernel.x86_64"], "value": [new_kernel]},
+        {"kind": "removed", "path": ["system_info", "packages", "kernel.x86_64"], "value": [old_kernel]},
+    ]
+
+
+def test_duplicate_keys_reordered():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    packages = snapshot_y["system_info"]["packages"]
+    packages[1], packages[2] = packages[2], packages[1]
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == []
+
+
+def test_scalar_lists_compared_as_sets():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["wildfly_info"]["deployments"][0]["roles"] = ["user", "auditor"]
+
+    path = ["wildfly_info", "deployments", "a" * 40, "roles"]
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "added", "path": path, "value": ["auditor"]},
+        {"kind": "removed", "path": path, "value": ["admin"]},
+    ]
+
+    snapshot_y["wildfly_info"]["deployments"][0]["roles"] = ["user", "admin"]
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == []
+
+
+def test_type_changes():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["packages"] = None
+    snapshot_y["system_info"]["hostname"] = {"short": "host-a"}
+    snapshot_y["wildfly_info"]["deployments"] = {"a" * 40: snapshot_x["wildfly_info"]["deployments"][0]}
+
+    ret = diff_snapshots(snapshot_x, snapshot_y)
+    assert ret["items_changed"] == {
+        "system_info": {"packages": None, "hostname": {"short": "host-a"}},
+        "wildfly_info": {"deployments": snapshot_y["wildfly_info"]["deployments"]},
+    }
+    assert ret["items_added"] == {}
+    assert ret["items_removed"] == {}
+
+
+def test_unkeyed_lists_of_dicts_changed_whole():
+    snapshot_x = {"system_info": {"devices": [{"size": "100 GB"}]}}
+    snapshot_y = {"system_info": {"devices": [{"size": "200 GB"}]}}
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "changed", "path": ["system_info", "devices"], "value": [{"size": "200 GB"}]},
+    ]
+
+
+def test_missing_document():
+    snapshot = get_snapshot()
+
+    ret = diff_snapshots(None, snapshot)
+    assert ret["items_added"] == snapshot
+    assert ret["items_changed"] == {}
+    assert ret["items_removed"] == {}
+
+
+def test_equal_hashes_short_circuit():
+    # sections whose hashes are equal are not compared, even when their content differs
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["packages"][0]["version"] = "5.1-2.el9"
+    snapshot_y["system_info"]["mounts"][0]["size_available"] = 50
+
+    snapshot_x[SECTION_HASHES_KEY] = compute_section_hashes(snapshot_x)
+    snapshot_y[SECTION_HASHES_KEY] = copy.deepcopy(snapshot_x[SECTION_HASHES_KEY])
+    snapshot_y[SECTION_HASHES_KEY]["system_info"]["mounts"] = "changed"
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == [
+        {"kind": "changed", "path": ["system_info", "mounts", "/", "size_available"], "value": 50},
+    ]
+    # the documents of the caller are left untouched
+    assert snapshot_y["system_info"]["packages"][0]["version"] == "5.1-2.el9"
+
+
+def test_ignored_keys():
+    snapshot_x = get_snapshot()
+    snapshot_y = copy.deepcopy(snapshot_x)
+    snapshot_y["system_info"]["fingerprints"] = {"packages": "abc"}
+    snapshot_y[TIMINGS_KEY] = {"gatherer": {}}
+    snapshot_y[SECTION_HASHES_KEY] = compute_section_hashes(snapshot_y)
+
+    assert diff_snapshot_entries(snapshot_x, snapshot_y) == []